@@ -0,0 +1,35 @@
+"""unique_eventcategory_name
+
+Revision ID: 3f7a9b1c5d2e
+Revises: 8c1d4e2f9a31
+Create Date: 2026-10-16 11:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3f7a9b1c5d2e'
+down_revision: Union[str, Sequence[str], None] = '8c1d4e2f9a31'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Переименовываем дубликаты имен (кроме самой ранней категории) перед
+    # созданием уникального индекса; связи с устройствами сохраняются
+    op.execute(
+        "UPDATE eventcategory SET name = name || ' (' || id || ')' "
+        "WHERE id NOT IN (SELECT MIN(id) FROM eventcategory GROUP BY name)"
+    )
+    op.drop_index(op.f('ix_eventcategory_name'), table_name='eventcategory')
+    op.create_index(op.f('ix_eventcategory_name'), 'eventcategory', ['name'], unique=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_eventcategory_name'), table_name='eventcategory')
+    op.create_index(op.f('ix_eventcategory_name'), 'eventcategory', ['name'], unique=False)
@@ -0,0 +1,34 @@
+"""add_eventdevice_indexes
+
+Revision ID: 8c1d4e2f9a31
+Revises: 257010976e6d
+Create Date: 2026-10-16 10:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8c1d4e2f9a31'
+down_revision: Union[str, Sequence[str], None] = '257010976e6d'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Убираем дубликаты (категория, устройство) перед созданием уникального индекса
+    op.execute(
+        "DELETE FROM eventdevice WHERE id NOT IN ("
+        "SELECT MAX(id) FROM eventdevice GROUP BY event_category_id, device_id)"
+    )
+    op.create_index(op.f('ix_eventdevice_device_id'), 'eventdevice', ['device_id'], unique=False)
+    op.create_index('ix_eventdevice_cat_dev', 'eventdevice', ['event_category_id', 'device_id'], unique=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_eventdevice_cat_dev', table_name='eventdevice')
+    op.drop_index(op.f('ix_eventdevice_device_id'), table_name='eventdevice')
@@ -0,0 +1,36 @@
+"""
+Сжатие ответов
+"""
+
+from starlette.middleware.gzip import GZipMiddleware
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+
+class JSONGZipMiddleware:
+    """GZip для обычных ответов, SSE-поток проходит мимо
+
+    Сжатие SSE буферизует кадры и держит отдельный компрессор на каждое
+    соединение, поэтому запросы потока событий (Accept: text/event-stream
+    или путь .../events/stream) отдаются без GZipMiddleware. Проверка по
+    запросу не зависит от версии Starlette - старые версии не исключают
+    text/event-stream сами.
+    """
+
+    def __init__(self, app: ASGIApp, minimum_size: int = 1024):
+        self.app = app
+        self.gzip = GZipMiddleware(app, minimum_size=minimum_size)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] == "http" and not _is_event_stream(scope):
+            await self.gzip(scope, receive, send)
+        else:
+            await self.app(scope, receive, send)
+
+
+def _is_event_stream(scope: Scope) -> bool:
+    if scope["path"].endswith("/events/stream"):
+        return True
+    for name, value in scope["headers"]:
+        if name == b"accept":
+            return b"text/event-stream" in value
+    return False
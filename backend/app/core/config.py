@@ -15,6 +15,8 @@ def get_settings() -> Dict[str, Any]:
         "DEBUG": os.getenv("DEBUG", "false").lower() == "true",
         "DB_PATH": os.getenv("DB_PATH", "shaplych_monitoring.db"),
         "DB_ECHO": os.getenv("DB_ECHO", "false").lower() == "true",
+        "DB_POOL_SIZE": int(os.getenv("DB_POOL_SIZE", "20")),
+        "DB_MAX_OVERFLOW": int(os.getenv("DB_MAX_OVERFLOW", "40")),
     }
 
 settings = get_settings()
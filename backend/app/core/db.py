@@ -2,15 +2,39 @@
 База данных
 """
 
+from sqlalchemy import event
 from sqlmodel import SQLModel, create_engine, Session
 from .config import settings
 
 # Создаем движок базы данных
+# check_same_thread=False: синхронные эндпоинты FastAPI выполняются в пуле
+# потоков, и соединение может вернуться в пул из другого потока
 engine = create_engine(
     f"sqlite:///{settings['DB_PATH']}",
-    echo=settings.get('DB_ECHO', False)
+    echo=settings.get('DB_ECHO', False),
+    connect_args={"check_same_thread": False},
+    # Пул соединений на все обработчики с Depends(get_session)
+    pool_size=settings['DB_POOL_SIZE'],
+    max_overflow=settings['DB_MAX_OVERFLOW'],
+    pool_pre_ping=True,
+    pool_recycle=1800
 )
 
+
+@event.listens_for(engine, "connect")
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    """Настроить каждое новое соединение SQLite
+
+    WAL: чтение API не блокируется записью статусов мониторингом.
+    synchronous=NORMAL: в режиме WAL fsync только при checkpoint, а не на
+    каждый commit - целостность базы сохраняется.
+    """
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.close()
+
+
 def create_db_and_tables():
     """Создать базу данных и таблицы"""
     # Импортируем все модели
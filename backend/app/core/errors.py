@@ -0,0 +1,44 @@
+"""
+Обработка непредвиденных ошибок
+"""
+
+import logging
+
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+logger = logging.getLogger(__name__)
+
+
+class UnhandledErrorMiddleware:
+    """Единый обработчик необработанных исключений -> 500
+
+    Заменяет try/except Exception в каждом эндпоинте. Подключается внутри
+    CORSMiddleware, чтобы ответ 500 тоже получал CORS-заголовки. Текст
+    исключения пишется в лог и не отдается клиенту.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        response_started = False
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal response_started
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        except Exception:
+            logger.exception(f"Необработанная ошибка: {scope['method']} {scope['path']}")
+            if response_started:
+                raise
+            response = JSONResponse({"detail": "Внутренняя ошибка сервера"}, status_code=500)
+            await response(scope, receive, send)
@@ -1,7 +1,11 @@
+import asyncio
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
+from .core.compression import JSONGZipMiddleware
 from .core.config import settings
+from .core.errors import UnhandledErrorMiddleware
 from .routers import health
 from .routers import devices
 from .routers import ping
@@ -16,26 +20,41 @@ from .services.monitoring import monitoring_service
 from .services.event_categories import event_category_service
 
 
+# Фиксированные списки вместо "*": CORSMiddleware один раз собирает из них
+# заголовки preflight-ответа, а не зеркалит запрос на каждом OPTIONS
+CORS_ORIGINS = (
+    "http://localhost:5173",
+    "http://127.0.0.1:5173",
+    "http://localhost:5174",
+    "http://127.0.0.1:5174",
+    "http://localhost:5180",
+    "http://127.0.0.1:5180",
+    "http://localhost:5181",
+    "http://127.0.0.1:5181",
+    "tauri://localhost",
+)
+CORS_METHODS = ("GET", "POST", "PUT", "DELETE", "PATCH", "OPTIONS")
+CORS_HEADERS = ("authorization", "content-type", "accept", "cache-control", "if-none-match")
+CORS_EXPOSE_HEADERS = ("etag",)
+
+
 def create_app() -> FastAPI:
     app = FastAPI(title=settings["APP_NAME"], version=settings["VERSION"], docs_url=f"{settings['API_PREFIX']}/docs", redoc_url=None)
 
+    # Необработанные исключения -> 500 (добавляется первым, чтобы CORS был снаружи)
+    app.add_middleware(UnhandledErrorMiddleware)
+
+    # Сжатие JSON-ответов; SSE-поток не сжимается
+    app.add_middleware(JSONGZipMiddleware, minimum_size=1024)
+
     # CORS для локального фронтенда/tauri
     app.add_middleware(
         CORSMiddleware,
-        allow_origins=[
-            "http://localhost:5173",
-            "http://127.0.0.1:5173",
-            "http://localhost:5174",
-            "http://127.0.0.1:5174",
-            "http://localhost:5180",
-            "http://127.0.0.1:5180",
-            "http://localhost:5181",
-            "http://127.0.0.1:5181",
-            "tauri://localhost",
-        ],
+        allow_origins=CORS_ORIGINS,
         allow_credentials=True,
-        allow_methods=["*"],
-        allow_headers=["*"]
+        allow_methods=CORS_METHODS,
+        allow_headers=CORS_HEADERS,
+        expose_headers=CORS_EXPOSE_HEADERS,
     )
 
     # Routers
@@ -68,19 +87,22 @@ app = create_app()
 async def on_startup():
     create_db_and_tables()
     
-    # Автоматически запускаем мониторинг при старте приложения
-    try:
-        await monitoring_service.start()
+    # Мониторинг и категории мероприятий независимы - запускаем параллельно
+    monitoring_result, categories_result = await asyncio.gather(
+        monitoring_service.start(),
+        event_category_service.initialize_active_categories(),
+        return_exceptions=True,
+    )
+    
+    if isinstance(monitoring_result, Exception):
+        print(f"⚠️ Ошибка запуска мониторинга: {monitoring_result}")
+    else:
         print("🚀 Автоматический мониторинг турникетов запущен")
-    except Exception as e:
-        print(f"⚠️ Ошибка запуска мониторинга: {e}")
     
-    # Инициализируем активные категории мероприятий
-    try:
-        await event_category_service.initialize_active_categories()
+    if isinstance(categories_result, Exception):
+        print(f"⚠️ Ошибка инициализации категорий: {categories_result}")
+    else:
         print("📋 Активные категории мероприятий инициализированы")
-    except Exception as e:
-        print(f"⚠️ Ошибка инициализации категорий: {e}")
 
 @app.on_event("shutdown")
 async def on_shutdown():
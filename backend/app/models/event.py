@@ -3,26 +3,37 @@
 """
 
 from typing import List, Optional
-from sqlmodel import SQLModel, Field
+from sqlalchemy import Index
+from sqlmodel import SQLModel, Field, Relationship
 from datetime import datetime
 
 class EventCategory(SQLModel, table=True):
     """Категория мероприятия"""
     id: Optional[int] = Field(default=None, primary_key=True)
-    name: str = Field(index=True, max_length=100)
+    name: str = Field(index=True, unique=True, max_length=100)
     description: Optional[str] = Field(default=None, max_length=500)
     is_active: bool = Field(default=True)
     created_at: datetime = Field(default_factory=datetime.utcnow)
     updated_at: datetime = Field(default_factory=datetime.utcnow)
 
+    devices: List["EventDevice"] = Relationship(back_populates="category")
+
 class EventDevice(SQLModel, table=True):
     """Связь устройства с мероприятием"""
+    # Составной индекс начинается с event_category_id и обслуживает все выборки
+    # по категории - отдельный индекс на event_category_id не нужен
+    __table_args__ = (
+        Index("ix_eventdevice_cat_dev", "event_category_id", "device_id", unique=True),
+    )
+
     id: Optional[int] = Field(default=None, primary_key=True)
     event_category_id: int = Field(foreign_key="eventcategory.id")
-    device_id: str = Field(max_length=50)
+    device_id: str = Field(max_length=50, index=True)
     is_enabled: bool = Field(default=True)
     created_at: datetime = Field(default_factory=datetime.utcnow)
 
+    category: Optional[EventCategory] = Relationship(back_populates="devices")
+
 class EventCategoryCreate(SQLModel):
     """Создание категории мероприятия"""
     name: str = Field(max_length=100)
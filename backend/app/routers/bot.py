@@ -4,29 +4,20 @@ Router для управления Telegram ботом
 """
 
 import asyncio
-import json
+import time
 from pathlib import Path
-from typing import Dict, Any, Optional, List
+from typing import Dict, Any, Optional, List, Tuple
 from datetime import datetime
 
 from fastapi import APIRouter, HTTPException, BackgroundTasks
 from pydantic import BaseModel
 
+from ..services.monitoring import monitoring_service
 from ..services.telegram_bot import telegram_bot_service
+from ..utils.config_files import parse_chat_ids, read_json_cached, write_json_atomic
 
 router = APIRouter()
 
-class BotStatus(BaseModel):
-    """Статус бота"""
-    is_running: bool
-    uptime: Optional[str] = None
-    messages_sent: int = 0
-    commands_processed: int = 0
-    authorized_users: int = 0
-    notification_subscribers: int = 0
-    last_start: Optional[str] = None
-    error: Optional[str] = None
-
 class BotConfig(BaseModel):
     """Конфигурация бота"""
     token: str
@@ -37,37 +28,51 @@ class BotConfig(BaseModel):
 bot_task: Optional[asyncio.Task] = None
 bot_start_time: Optional[datetime] = None
 
+# UI опрашивает /status раз в 1-2 секунды - отдаем ответ из кэша в пределах TTL
+STATUS_CACHE_TTL = 0.5
+_status_cache: Tuple[float, Optional[Dict[str, Any]]] = (0.0, None)
+
+def _invalidate_status_cache():
+    """Сбросить кэш статуса (после запуска/остановки бота)"""
+    global _status_cache
+    _status_cache = (0.0, None)
+
 def _read_bot_config() -> Dict[str, Any]:
     """Читает конфигурацию бота из config.json"""
     BASE_DIR = Path(__file__).parent.parent.parent.parent
     config_path = BASE_DIR / "config.json"
-    if not config_path.exists():
-        return {}
-    
-    with open(config_path, 'r', encoding='utf-8') as f:
-        return json.load(f)
+    # Копия: PUT /config изменяет результат перед записью
+    return dict(read_json_cached(config_path))
 
 def _write_bot_config(config_data: Dict[str, Any]):
     """Записывает конфигурацию бота в config.json"""
     BASE_DIR = Path(__file__).parent.parent.parent.parent
     config_path = BASE_DIR / "config.json"
-    with open(config_path, 'w', encoding='utf-8') as f:
-        json.dump(config_data, f, ensure_ascii=False, indent=2)
+    write_json_atomic(config_path, config_data)
 
-@router.get("/status", response_model=BotStatus, summary="Получить статус Telegram бота")
+@router.get("/status", summary="Получить статус Telegram бота")
 async def get_bot_status():
     """Получить текущий статус бота"""
+    global _status_cache
+    now = time.monotonic()
+    cached_at, cached_status = _status_cache
+    if cached_status is not None and now - cached_at < STATUS_CACHE_TTL:
+        return cached_status
+    
     status = telegram_bot_service.get_status()
     
-    return BotStatus(
-        is_running=status["is_running"],
-        uptime=status["uptime"],
-        messages_sent=status["messages_sent"],
-        commands_processed=status["commands_processed"],
-        authorized_users=status["authorized_users"],
-        notification_subscribers=status["notification_subscribers"],
-        last_start=status["start_time"]
-    )
+    bot_status = {
+        "is_running": status["is_running"],
+        "uptime": status["uptime"],
+        "messages_sent": status["messages_sent"],
+        "commands_processed": status["commands_processed"],
+        "authorized_users": status["authorized_users"],
+        "notification_subscribers": status["notification_subscribers"],
+        "last_start": status["start_time"],
+        "error": None,
+    }
+    _status_cache = (now, bot_status)
+    return bot_status
 
 @router.post("/start", summary="Запустить Telegram бота")
 async def start_bot(background_tasks: BackgroundTasks):
@@ -81,9 +86,12 @@ async def start_bot(background_tasks: BackgroundTasks):
         # Запускаем бота в фоновой задаче
         bot_task = asyncio.create_task(telegram_bot_service.start())
         bot_start_time = datetime.now()
+        _invalidate_status_cache()
         
         # Ждем немного, чтобы убедиться что бот запустился
         await asyncio.sleep(1)
+        # Опрос /status во время ожидания мог закэшировать is_running=False
+        _invalidate_status_cache()
         
         if telegram_bot_service.is_running:
             return {"success": True, "message": "Telegram бот запущен успешно"}
@@ -103,6 +111,7 @@ async def stop_bot():
     
     try:
         await telegram_bot_service.stop()
+        _invalidate_status_cache()
         
         if bot_task:
             bot_task.cancel()
@@ -122,17 +131,11 @@ async def get_bot_config():
     """Получить конфигурацию бота"""
     config_data = _read_bot_config()
     
-    chat_ids = config_data.get("chat_id", [])
-    if isinstance(chat_ids, (str, int)):
-        chat_ids = [int(chat_ids)]
-    elif isinstance(chat_ids, list):
-        chat_ids = [int(x) for x in chat_ids if str(x).isdigit()]
-    
     return {
         "exists": bool(config_data),
         "token": config_data.get("TOKEN", ""),
         "time_connect": int(config_data.get("time_connect", 50)),
-        "chat_ids": chat_ids
+        "chat_ids": parse_chat_ids(config_data.get("chat_id", []))
     }
 
 @router.put("/config", summary="Обновить конфигурацию бота")
@@ -148,6 +151,12 @@ async def update_bot_config(config: BotConfig):
         
         # Перезагружаем конфигурацию в сервисе
         telegram_bot_service.config = telegram_bot_service._load_config()
+        _invalidate_status_cache()
+        
+        # time_connect - интервал пинга мониторинга: применяем сразу, не
+        # дожидаясь периодической проверки конфигурации
+        if monitoring_service.is_running:
+            monitoring_service.request_reload()
         
         return {"success": True, "message": "Конфигурация бота обновлена успешно"}
         
@@ -3,7 +3,6 @@ Router для работы с конфигурационными данными
 Интеграция с IP_list.json и config.json из оригинального приложения
 """
 
-import json
 import os
 from pathlib import Path
 from typing import Dict, List, Any, Optional
@@ -11,6 +10,8 @@ from typing import Dict, List, Any, Optional
 from fastapi import APIRouter, HTTPException, Body
 from pydantic import BaseModel
 
+from ..utils.config_files import parse_chat_ids, read_json_cached, write_json_atomic
+
 router = APIRouter()
 
 # Пути к конфигурационным файлам
@@ -18,17 +19,8 @@ BASE_DIR = Path(__file__).parent.parent.parent
 IP_LIST_PATH = BASE_DIR / "IP_list.json"
 CONFIG_PATH = BASE_DIR / "config.json"
 
-def _determine_category(device_id: str, description: str) -> str:
-    """Определяет категорию устройства - все устройства турникеты"""
-    return "Турникет"
-
-class DeviceConfig(BaseModel):
-    """Модель конфигурации устройства"""
-    device_id: str
-    ip: str
-    description: str
-    category: str
-    enabled: bool
+# Категория устройства - все устройства турникеты
+_CATEGORY_TURNSTILE = "Турникет"
 
 class BotConfig(BaseModel):
     """Модель конфигурации бота"""
@@ -36,52 +28,39 @@ class BotConfig(BaseModel):
     time_connect: int
     chat_ids: List[int]
 
-class ConfigResponse(BaseModel):
-    """Ответ с конфигурационными данными"""
-    devices: List[DeviceConfig]
-    bot: BotConfig
-    total_devices: int
-    enabled_devices: int
-
 # --- Internal functions to read/write config files ---
 def _read_ip_list() -> Dict[str, List[str]]:
-    if not IP_LIST_PATH.exists():
-        return {}
-    with open(IP_LIST_PATH, 'r', encoding='utf-8') as f:
-        return json.load(f)
+    # Общий объект из кэша - только для чтения
+    return read_json_cached(IP_LIST_PATH)
 
 def _read_main_config() -> Dict[str, Any]:
-    if not CONFIG_PATH.exists():
-        return {}
-    with open(CONFIG_PATH, 'r', encoding='utf-8') as f:
-        return json.load(f)
+    # Копия: PUT /config/bot изменяет результат перед записью
+    return dict(read_json_cached(CONFIG_PATH))
 
 def _write_main_config(config_data: Dict[str, Any]):
-    with open(CONFIG_PATH, 'w', encoding='utf-8') as f:
-        json.dump(config_data, f, ensure_ascii=False, indent=2)
+    write_json_atomic(CONFIG_PATH, config_data)
 
 # --- API Endpoints ---
-@router.get("/config", response_model=ConfigResponse, summary="Get full application configuration")
+@router.get("/config", summary="Get full application configuration")
 async def get_full_config():
     devices = []
     ip_data = _read_ip_list()
     for device_id, device_info in ip_data.items():
         if len(device_info) >= 3:
             ip, description, enabled = device_info[0], device_info[1], bool(int(device_info[2]))
-            category = _determine_category(device_id, description)
-            devices.append(DeviceConfig(device_id=device_id, ip=ip, description=description, category=category, enabled=enabled))
+            devices.append({"device_id": device_id, "ip": ip, "description": description, "category": _CATEGORY_TURNSTILE, "enabled": enabled})
 
     config_data = _read_main_config()
-    bot_config = BotConfig(
-        token=config_data.get("TOKEN", ""),
-        time_connect=int(config_data.get("time_connect", 50)),
-        chat_ids=config_data.get("chat_id", [])
-    )
+    bot_config = {
+        "token": config_data.get("TOKEN", ""),
+        "time_connect": int(config_data.get("time_connect", 50)),
+        "chat_ids": parse_chat_ids(config_data.get("chat_id", []))
+    }
 
     total_devices = len(devices)
-    enabled_devices = sum(1 for device in devices if device.enabled)
+    enabled_devices = sum(1 for device in devices if device["enabled"])
 
-    return ConfigResponse(devices=devices, bot=bot_config, total_devices=total_devices, enabled_devices=enabled_devices)
+    return {"devices": devices, "bot": bot_config, "total_devices": total_devices, "enabled_devices": enabled_devices}
 
 @router.get("/config/devices", summary="Get device configuration")
 async def get_devices_config():
@@ -90,8 +69,7 @@ async def get_devices_config():
     for device_id, device_info in ip_data.items():
         if len(device_info) >= 3:
             ip, description, enabled = device_info[0], device_info[1], bool(int(device_info[2]))
-            category = _determine_category(device_id, description)
-            devices.append({"device_id": device_id, "ip": ip, "description": description, "category": category, "enabled": enabled})
+            devices.append({"device_id": device_id, "ip": ip, "description": description, "category": _CATEGORY_TURNSTILE, "enabled": enabled})
     return {"devices": devices, "total": len(devices)}
 
 @router.get("/config/bot", summary="Get Telegram bot configuration")
@@ -100,7 +78,7 @@ async def get_bot_config():
     return {
         "token": config_data.get("TOKEN", ""),
         "time_connect": int(config_data.get("time_connect", 50)),
-        "chat_ids": config_data.get("chat_id", []),
+        "chat_ids": parse_chat_ids(config_data.get("chat_id", [])),
         "exists": bool(config_data.get("TOKEN"))
     }
 
@@ -120,8 +98,7 @@ async def get_config_stats():
     for device_id, device_info in ip_data.items():
         if len(device_info) >= 3:
             enabled = bool(int(device_info[2]))
-            category = _determine_category(device_id, device_info[1])
-            devices.append({"category": category, "enabled": enabled})
+            devices.append({"category": _CATEGORY_TURNSTILE, "enabled": enabled})
 
     category_stats = {}
     for device in devices:
@@ -5,30 +5,43 @@ Router для управления устройствами
 from datetime import datetime
 from typing import List
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
 from sqlmodel import Session, select
 
 from ..core.db import get_session
 from ..models.device import Device, DeviceCreate, DeviceUpdate
+from ..services.monitoring import monitoring_service
+from ..utils.http_cache import not_modified, set_etag, weak_etag
+from ..utils.responses import trusted_json_response
 
 
 router = APIRouter()
 
 
+# Чтение из синхронной сессии выполняется в пуле потоков (def вместо async def),
+# чтобы запросы к БД не блокировали event loop
 @router.get("/devices/", response_model=List[Device], summary="Получить список устройств")
-async def list_devices(session: Session = Depends(get_session)):
+def list_devices(request: Request, session: Session = Depends(get_session)):
+    # ETag по агрегатам: список не сериализуется, если клиент уже его видел
+    count, last_update, last_check = session.exec(
+        select(func.count(Device.id), func.max(Device.updated_at), func.max(Device.last_check))
+    ).one()
+    etag = weak_etag(count, last_update, last_check)
+    cached = not_modified(request, etag)
+    if cached is not None:
+        return cached
+    
     devices = session.exec(select(Device)).all()
-    return devices
+    response = trusted_json_response([device.model_dump() for device in devices])
+    set_etag(response, etag)
+    return response
 
 
 @router.post("/devices/", response_model=Device, status_code=201, summary="Создать устройство")
 async def create_device(device_data: DeviceCreate, session: Session = Depends(get_session)):
-    # Проверка уникальности device_id
-    existing = session.exec(select(Device).where(Device.device_id == device_data.device_id)).first()
-    if existing:
-        raise HTTPException(status_code=400, detail="Устройство с таким device_id уже существует")
-
-    # Создаем устройство
+    # Создаем устройство (уникальность device_id гарантирует индекс БД)
     device = Device(
         device_id=device_data.device_id,
         ip=device_data.ip,
@@ -38,20 +51,20 @@ async def create_device(device_data: DeviceCreate, session: Session = Depends(ge
         enabled=device_data.enabled,
     )
     session.add(device)
-    session.commit()
+    # Перезагрузка мониторинга запросится только после успешного commit
+    monitoring_service.reload_after_commit(session)
+    try:
+        session.commit()
+    except IntegrityError:
+        session.rollback()
+        raise HTTPException(status_code=400, detail="Устройство с таким device_id уже существует")
     session.refresh(device)
     
-    # Если мониторинг активен, перезагружаем конфигурацию
-    from ..services.monitoring import monitoring_service
-    if monitoring_service.is_running:
-        import asyncio
-        asyncio.create_task(monitoring_service._reload_configuration())
-    
     return device
 
 
 @router.get("/devices/{device_id}", response_model=Device, summary="Получить устройство по ID записи")
-async def get_device(device_id: int, session: Session = Depends(get_session)):
+def get_device(device_id: int, session: Session = Depends(get_session)):
     device = session.get(Device, device_id)
     if not device:
         raise HTTPException(status_code=404, detail="Устройство не найдено")
@@ -64,26 +77,24 @@ async def update_device(device_id: int, updates: DeviceUpdate, session: Session
     if not device:
         raise HTTPException(status_code=404, detail="Устройство не найдено")
 
-    update_data = updates.dict(exclude_unset=True)
+    # Только поля, переданные клиентом, без построения промежуточного dict
+    fields_set = updates.model_fields_set
     
     # Проверяем изменились ли критичные поля (enabled, ip, device_id)
-    needs_reload = any(field in update_data for field in ['enabled', 'ip'])
+    needs_reload = 'enabled' in fields_set or 'ip' in fields_set
     
-    for field, value in update_data.items():
-        setattr(device, field, value)
+    for field in fields_set:
+        setattr(device, field, getattr(updates, field))
     device.updated_at = datetime.utcnow()
 
+    # Перезагружаем мониторинг если изменились критичные поля
+    if needs_reload:
+        monitoring_service.reload_after_commit(session)
+
     session.add(device)
     session.commit()
     session.refresh(device)
     
-    # Перезагружаем мониторинг если изменились критичные поля
-    if needs_reload:
-        from ..services.monitoring import monitoring_service
-        if monitoring_service.is_running:
-            import asyncio
-            asyncio.create_task(monitoring_service._reload_configuration())
-    
     return device
 
 
@@ -94,12 +105,8 @@ async def delete_device(device_id: int, session: Session = Depends(get_session))
         raise HTTPException(status_code=404, detail="Устройство не найдено")
 
     session.delete(device)
-    session.commit()
-    
     # Перезагружаем мониторинг после удаления
-    from ..services.monitoring import monitoring_service
-    if monitoring_service.is_running:
-        import asyncio
-        asyncio.create_task(monitoring_service._reload_configuration())
+    monitoring_service.reload_after_commit(session)
+    session.commit()
     
     return None
@@ -2,14 +2,11 @@
 Router для событий (SSE)
 """
 
-import asyncio
-import json
 import logging
-from datetime import datetime
 from fastapi import APIRouter, Request
-from fastapi.responses import StreamingResponse
 
-from ..utils.events_bus import event_manager, SSEResponse
+from ..utils.clock import iso_now
+from ..utils.events_bus import event_manager, SSEResponse, SSEStreamResponse
 
 logger = logging.getLogger(__name__)
 
@@ -24,7 +21,7 @@ async def stream_events(request: Request):
         sse_response = SSEResponse()
         
         # Подписываемся на события
-        await event_manager.subscribe(sse_response.send_event)
+        event_manager.subscribe_sse(sse_response)
         
         try:
             # Отправляем приветственное сообщение
@@ -32,7 +29,7 @@ async def stream_events(request: Request):
                 "type": "connection",
                 "data": {
                     "status": "connected",
-                    "timestamp": datetime.utcnow().isoformat(),
+                    "timestamp": iso_now(),
                     "message": "Подключение к потоку событий установлено"
                 }
             })
@@ -53,13 +50,12 @@ async def stream_events(request: Request):
             logger.error(f"Ошибка в генераторе событий: {e}")
         finally:
             # Отписываемся от событий
-            await event_manager.unsubscribe(sse_response.send_event)
+            event_manager.unsubscribe_sse(sse_response)
             await sse_response.close()
             logger.info("SSE соединение закрыто")
 
-    return StreamingResponse(
+    return SSEStreamResponse(
         event_generator(),
-        media_type="text/event-stream",
         headers={
             "Cache-Control": "no-cache",
             "Connection": "keep-alive",
@@ -78,7 +74,7 @@ async def get_recent_events(limit: int = 10):
     return {
         "events": events,
         "count": len(events),
-        "timestamp": datetime.utcnow().isoformat()
+        "timestamp": iso_now()
     }
 
 
@@ -88,5 +84,5 @@ async def get_event_stats():
     return {
         "active_subscribers": event_manager.get_subscriber_count(),
         "recent_events_count": len(event_manager.get_recent_events(100)),
-        "timestamp": datetime.utcnow().isoformat()
+        "timestamp": iso_now()
     }
@@ -2,8 +2,11 @@
 Router для проверки здоровья системы
 """
 
-from fastapi import APIRouter
-from datetime import datetime
+from fastapi import APIRouter, HTTPException
+from sqlalchemy import text
+
+from ..core.db import engine
+from ..utils.clock import iso_now_local
 
 router = APIRouter()
 
@@ -12,6 +15,20 @@ async def health_check():
     """Проверка здоровья системы"""
     return {
         "status": "healthy",
-        "timestamp": datetime.now().isoformat(),
+        "timestamp": iso_now_local(),
         "service": "Shaplych Monitoring System"
     }
+
+@router.get("/health/ready", summary="Проверка готовности (БД)")
+def readiness_check():
+    """Проверка готовности: SELECT 1 через соединение из пула"""
+    try:
+        with engine.connect() as connection:
+            connection.execute(text("SELECT 1"))
+    except Exception as e:
+        raise HTTPException(status_code=503, detail=f"База данных недоступна: {e}")
+    return {
+        "status": "ready",
+        "timestamp": iso_now_local(),
+        "database": "ok"
+    }
@@ -42,8 +42,8 @@ async def ping_all_now():
         return {
             "results": results,
             "total_devices": len(results),
-            "online_count": sum(1 for r in results if r["status"] == "online"),
-            "offline_count": sum(1 for r in results if r["status"] == "offline"),
+            "online_count": sum(1 for r in results if r.status == "online"),
+            "offline_count": sum(1 for r in results if r.status == "offline"),
             "success": True
         }
     except Exception as e:
@@ -4,51 +4,156 @@ Router для ping операций
 
 import asyncio
 from datetime import datetime
-from typing import List
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
 
 from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy import or_, update
 from sqlmodel import Session, select
-from icmplib import ping as icmp_ping
+from icmplib import async_multiping, async_ping
 
-from ..core.db import get_session
+try:
+    # Rust-реализация ICMP: один raw-сокет на все запросы (только Linux/macOS)
+    from gufo.ping import Ping as GufoPing
+except ImportError:
+    GufoPing = None
+
+from ..core.db import engine, get_session
 from ..models.device import Device
+from ..utils.config_files import read_json_cached_async
 from ..utils.events_bus import event_manager
+from ..utils.responses import trusted_json_response
 
 
 router = APIRouter()
 
 
-async def _ping_ip(ip_address: str, count: int = 1, timeout: int = 2):
+BASE_DIR = Path(__file__).parent.parent.parent
+IP_LIST_PATH = BASE_DIR / "IP_list.json"
+
+# Ограничение параллельных ICMP-запросов в async_multiping
+MAX_CONCURRENT_PINGS = 256
+
+
+# Результат пинга - кортеж (alive, avg_ms): дешевле словаря и
+# распаковывается без поиска по ключам
+IcmpOutcome = Tuple[bool, Optional[int]]
+PING_FAILED: IcmpOutcome = (False, None)
+
+
+def _host_result(host) -> IcmpOutcome:
+    avg_rtt = getattr(host, 'avg_rtt', None)
+    return (
+        getattr(host, 'is_alive', False),
+        int(avg_rtt * 1000) if (avg_rtt is not None) else None,
+    )
+
+
+# timeout -> экземпляр gufo Ping (сокеты создаются один раз)
+_gufo_pingers: Dict[float, "GufoPing"] = {}
+# Выключается, если gufo не может открыть сокет (нет прав на raw ICMP)
+_gufo_available = GufoPing is not None
+
+
+def _gufo_result(rtt: Optional[float]) -> IcmpOutcome:
+    # gufo отдает RTT в секундах, icmplib - в миллисекундах; приводим
+    # к тому же масштабу, что и _host_result
+    if rtt is None:
+        return PING_FAILED
+    return (True, int(rtt * 1000 * 1000))
+
+
+async def _load_ip_list() -> dict:
+    """IP_list.json из кэша (перечитывается в потоке только при изменении mtime)"""
     try:
-        # icmplib.ping является синхронной функцией; оборачиваем в тред-пул
-        loop = asyncio.get_running_loop()
-        result = await loop.run_in_executor(None, lambda: icmp_ping(ip_address, count=count, timeout=timeout))
-        is_alive = getattr(result, 'is_alive', False)
-        avg_rtt = getattr(result, 'avg_rtt', None)
-        return {
-            "alive": is_alive,
-            "avg_ms": int(avg_rtt * 1000) if (avg_rtt is not None) else None,
-        }
+        return await read_json_cached_async(IP_LIST_PATH)
     except Exception:
-        return {"alive": False, "avg_ms": None}
+        return {}
 
 
-@router.post("/ping/all", response_model=List[dict], summary="Выполнить ping всех устройств из конфигурации")
-async def ping_all_devices(session: Session = Depends(get_session)):
-    # Загружаем список устройств из IP_list.json, чтобы соответствовать фронтенду
-    from pathlib import Path
-    import json
+async def _ping_ip(ip_address: str, count: int = 1, timeout: int = 2) -> IcmpOutcome:
+    try:
+        # Нативный асинхронный ping icmplib - без тред-пула
+        return _host_result(await async_ping(ip_address, count=count, timeout=timeout))
+    except Exception:
+        return PING_FAILED
 
-    BASE_DIR = Path(__file__).parent.parent.parent
-    ip_list_path = BASE_DIR / "IP_list.json"
 
-    ip_entries = {}
-    if ip_list_path.exists():
-        try:
-            with open(ip_list_path, 'r', encoding='utf-8') as f:
-                ip_entries = json.load(f)
-        except Exception:
-            ip_entries = {}
+async def _ping_each(ips: List[str], count: int = 1, timeout: int = 2) -> List[IcmpOutcome]:
+    """Пинг адресов по отдельности, не больше MAX_CONCURRENT_PINGS одновременно
+
+    Каждый async_ping открывает свой сокет - без ограничения тысячи
+    адресов означали бы тысячи сокетов сразу.
+    """
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_PINGS)
+
+    async def _bounded(ip: str) -> IcmpOutcome:
+        async with semaphore:
+            return await _ping_ip(ip, count, timeout)
+
+    return await asyncio.gather(*[_bounded(ip) for ip in ips])
+
+
+async def _ping_many(ips: List[str], count: int = 1, timeout: int = 2) -> List[IcmpOutcome]:
+    """Пинг списка адресов одним вызовом async_multiping
+
+    Результаты возвращаются в порядке ips. Если пакетный вызов падает
+    (например, не резолвится одно из имен), пингуем адреса по отдельности,
+    чтобы ошибка одного адреса не обнуляла остальные.
+    """
+    if not ips:
+        return []
+    if _gufo_available and count == 1:
+        results = await _ping_many_gufo(ips, timeout)
+        if results is not None:
+            return results
+    try:
+        hosts = await async_multiping(
+            ips, count=count, timeout=timeout,
+            concurrent_tasks=min(len(ips), MAX_CONCURRENT_PINGS)
+        )
+        return [_host_result(host) for host in hosts]
+    except Exception:
+        # Фоллбек тоже на async_ping: ожидание ICMP не занимает потоки общего
+        # пула, в котором выполняются sync-обработчики и запросы к БД
+        return await _ping_each(ips, count, timeout)
+
+
+async def _ping_many_gufo(ips: List[str], timeout: float) -> Optional[List[IcmpOutcome]]:
+    """Пинг списка адресов через gufo-ping
+
+    Возвращает None, если gufo недоступен - тогда работает icmplib. Адреса,
+    которые gufo не принял (например, имена хостов), пингуются через icmplib.
+    """
+    global _gufo_available
+    try:
+        pinger = _gufo_pingers.get(timeout)
+        if pinger is None:
+            pinger = _gufo_pingers[timeout] = GufoPing(timeout=float(timeout))
+        rtts = await asyncio.gather(*[pinger.ping(ip) for ip in ips], return_exceptions=True)
+    except (PermissionError, OSError):
+        _gufo_available = False
+        return None
+
+    if any(isinstance(rtt, PermissionError) for rtt in rtts):
+        _gufo_available = False
+        return None
+
+    results = [None if isinstance(rtt, BaseException) else _gufo_result(rtt) for rtt in rtts]
+    retry = [i for i, result in enumerate(results) if result is None]
+    if retry:
+        for i, result in zip(retry, await _ping_each([ips[i] for i in retry], 1, timeout)):
+            results[i] = result
+    return results
+
+
+@router.post("/ping/all", response_model=List[dict], summary="Выполнить ping всех устройств из конфигурации")
+async def ping_all_devices():
+    # Сессия не берется через Depends: соединение из пула занимаем только
+    # на короткие обращения к БД, а не на все время ожидания ICMP
+
+    # Загружаем список устройств из IP_list.json, чтобы соответствовать фронтенду
+    ip_entries = await _load_ip_list()
 
     # Преобразуем в список (device_id, ip)
     config_devices = []
@@ -58,67 +163,91 @@ async def ping_all_devices(session: Session = Depends(get_session)):
 
     # Если конфиг пуст, падаем назад на БД
     if not config_devices:
-        db_devices: List[Device] = session.exec(select(Device)).all()
-        config_devices = [(d.device_id, d.ip) for d in db_devices]
+        with Session(engine) as session:
+            config_devices = [
+                (device_id, ip)
+                for device_id, ip in session.exec(select(Device.device_id, Device.ip)).all()
+            ]
 
-    tasks = [_ping_ip(ip) for _, ip in config_devices]
-    results = await asyncio.gather(*tasks, return_exceptions=False)
+    results = await _ping_many([ip for _, ip in config_devices])
 
-    now_iso = datetime.utcnow().isoformat()
+    now = datetime.utcnow()
+    now_iso = now.isoformat()
     responses = []
 
-    # Обновляем БД при наличии записи, но не требуем
-    for (dev_id, ip), res in zip(config_devices, results):
-        db_device: Device | None = session.exec(select(Device).where(Device.device_id == dev_id)).first()
-        if db_device:
-            db_device.status = "online" if res["alive"] else "offline"
-            db_device.response_ms = res["avg_ms"]
-            db_device.last_check = datetime.utcnow()
-            session.add(db_device)
-
-        payload = {
+    for (dev_id, ip), (alive, avg_ms) in zip(config_devices, results):
+        responses.append({
             "device_id": dev_id,
             "ip": ip,
-            "status": "online" if res["alive"] else "offline",
-            "response_time": res["avg_ms"],
+            "status": "online" if alive else "offline",
+            "response_time": avg_ms,
             "timestamp": now_iso,
-        }
-        responses.append(payload)
-        # Публикуем событие в SSE
-        await event_manager.publish({
-            "type": "device_status",
-            "timestamp": now_iso,
-            "data": payload,
         })
-    session.commit()
-    return responses
+
+    # Обновляем БД при наличии записи, но не требуем
+    with Session(engine) as session:
+        # id записей БД для всех устройств одним запросом IN
+        dev_ids = [dev_id for dev_id, _ in config_devices]
+        db_ids = dict(
+            session.exec(select(Device.device_id, Device.id).where(Device.device_id.in_(dev_ids))).all()
+        )
+        mappings = [
+            {
+                "id": db_ids[payload["device_id"]],
+                "status": payload["status"],
+                "response_ms": payload["response_time"],
+                "last_check": now,
+            }
+            for payload in responses
+            if payload["device_id"] in db_ids
+        ]
+
+        # Один executemany UPDATE по первичному ключу вместо flush N объектов
+        if mappings:
+            session.execute(update(Device), mappings)
+            session.commit()
+
+    # Все статусы одним событием вместо отдельного события на устройство
+    await event_manager.publish({
+        "type": "device_status_bulk",
+        "timestamp": now_iso,
+        "data": responses,
+    })
+    # Список собран здесь же из простых типов - сериализуем orjson напрямую
+    return trusted_json_response(responses)
 
 
 @router.get("/ping/device/{device_key}", summary="Пинг устройства по числовому ID или по device_id")
 async def ping_device(device_key: str, session: Session = Depends(get_session)):
-    device: Device | None = None
-
-    # Попытка как числовой первичный ключ
-    if device_key.isdigit():
-        device = session.get(Device, int(device_key))
-    # Если не найдено, ищем по device_id
-    if not device:
-        device = session.exec(select(Device).where(Device.device_id == device_key)).first()
+    # Один запрос и по числовому первичному ключу, и по device_id;
+    # совпадение по первичному ключу приоритетнее
+    pk = int(device_key) if device_key.isdigit() else None
+    condition = Device.device_id == device_key
+    if pk is not None:
+        condition = or_(Device.id == pk, condition)
+    candidates = session.exec(select(Device).where(condition).limit(2)).all()
+    device: Device | None = next(
+        (d for d in candidates if d.id == pk),
+        candidates[0] if candidates else None
+    )
 
     if device:
-        res = await _ping_ip(device.ip)
-        device.status = "online" if res["alive"] else "offline"
-        device.response_ms = res["avg_ms"]
-        device.last_check = datetime.utcnow()
-        session.add(device)
-        session.commit()
+        alive, avg_ms = await _ping_ip(device.ip)
+        now = datetime.utcnow()
+        device.status = "online" if alive else "offline"
+        device.response_ms = avg_ms
+        device.last_check = now
+        # payload собираем до commit: после него атрибуты истекают
+        # и чтение потребовало бы повторного SELECT
         payload = {
             "device_id": device.device_id,
             "ip": device.ip,
             "status": device.status,
             "response_time": device.response_ms,
-            "timestamp": datetime.utcnow().isoformat(),
+            "timestamp": now.isoformat(),
         }
+        session.add(device)
+        session.commit()
         await event_manager.publish({
             "type": "device_status",
             "timestamp": payload["timestamp"],
@@ -127,22 +256,17 @@ async def ping_device(device_key: str, session: Session = Depends(get_session)):
         return payload
 
     # Фоллбек: ищем IP в конфигурации
-    from pathlib import Path
-    import json
-    BASE_DIR = Path(__file__).parent.parent.parent
-    ip_list_path = BASE_DIR / "IP_list.json"
-    if ip_list_path.exists():
+    ip_entries = await _load_ip_list()
+    if ip_entries:
         try:
-            with open(ip_list_path, 'r', encoding='utf-8') as f:
-                ip_entries = json.load(f)
             if device_key in ip_entries and isinstance(ip_entries[device_key], list) and len(ip_entries[device_key]) >= 1:
                 ip = ip_entries[device_key][0]
-                res = await _ping_ip(ip)
+                alive, avg_ms = await _ping_ip(ip)
                 payload = {
                     "device_id": device_key,
                     "ip": ip,
-                    "status": "online" if res["alive"] else "offline",
-                    "response_time": res["avg_ms"],
+                    "status": "online" if alive else "offline",
+                    "response_time": avg_ms,
                     "timestamp": datetime.utcnow().isoformat(),
                 }
                 await event_manager.publish({
@@ -159,11 +283,11 @@ async def ping_device(device_key: str, session: Session = Depends(get_session)):
 
 @router.get("/ping/ip/{ip}", summary="Пинг по IP адресу")
 async def ping_ip(ip: str):
-    res = await _ping_ip(ip)
+    alive, avg_ms = await _ping_ip(ip)
     return {
         "device_id": ip,
         "ip": ip,
-        "status": "online" if res["alive"] else "offline",
-        "response_time": res["avg_ms"],
+        "status": "online" if alive else "offline",
+        "response_time": avg_ms,
         "timestamp": datetime.utcnow().isoformat(),
     }
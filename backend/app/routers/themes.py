@@ -4,6 +4,7 @@ Router для управления темами
 
 from typing import List
 from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.exc import IntegrityError
 from sqlmodel import Session, select
 
 from ..core.db import get_session
@@ -14,18 +15,19 @@ router = APIRouter()
 
 
 @router.get("/themes", response_model=List[ThemePreset], summary="Получить все темы")
-async def list_themes(session: Session = Depends(get_session)):
+def list_themes(session: Session = Depends(get_session)):
     return session.exec(select(ThemePreset)).all()
 
 
 @router.post("/themes", response_model=ThemePreset, status_code=201, summary="Создать тему")
 async def create_theme(preset: ThemePreset, session: Session = Depends(get_session)):
-    # Проверка уникальности имени
-    existing = session.exec(select(ThemePreset).where(ThemePreset.name == preset.name)).first()
-    if existing:
-        raise HTTPException(status_code=400, detail="Тема с таким именем уже существует")
+    # Уникальность имени обеспечивает индекс ix_themepreset_name
     session.add(preset)
-    session.commit()
+    try:
+        session.commit()
+    except IntegrityError:
+        session.rollback()
+        raise HTTPException(status_code=400, detail="Тема с таким именем уже существует")
     session.refresh(preset)
     return preset
 
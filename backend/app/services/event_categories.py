@@ -3,20 +3,27 @@
 Управление группировкой устройств для различных событий
 """
 
-import json
+import asyncio
 import logging
 from datetime import datetime
 from pathlib import Path
 from typing import Dict, List, Optional, Any
+from sqlalchemy import delete, exists, func, insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import selectinload
 from sqlmodel import Session, select
 
 from ..core.db import get_session
 from ..models.event import EventCategory, EventDevice, EventCategoryWithDevices
 from ..services.monitoring import monitoring_service
+from ..utils.config_files import read_json_cached
 from ..utils.events_bus import event_manager
 
 logger = logging.getLogger(__name__)
 
+BASE_DIR = Path(__file__).parent.parent.parent.parent
+IP_LIST_PATH = BASE_DIR / "IP_list.json"
+
 
 class EventCategoryService:
     """Сервис для управления категориями мероприятий"""
@@ -24,18 +31,16 @@ class EventCategoryService:
     def __init__(self):
         self.active_categories: Dict[int, Dict[str, Any]] = {}
         self.category_monitors: Dict[int, List[str]] = {}  # category_id -> [device_ids]
+        # Список устройств строится заново только при изменении IP_list.json
+        self._available_devices_source: Optional[Dict[str, Any]] = None
+        self._available_devices: List[Dict[str, Any]] = []
     
     def _load_available_devices(self) -> List[Dict[str, Any]]:
         """Загрузить доступные устройства из конфигурации"""
         try:
-            BASE_DIR = Path(__file__).parent.parent.parent.parent
-            ip_list_path = BASE_DIR / "IP_list.json"
-            
-            if not ip_list_path.exists():
-                return []
-            
-            with open(ip_list_path, 'r', encoding='utf-8') as f:
-                ip_data = json.load(f)
+            ip_data = read_json_cached(IP_LIST_PATH)
+            if ip_data is self._available_devices_source:
+                return self._available_devices
             
             devices = []
             for device_id, device_info in ip_data.items():
@@ -56,25 +61,46 @@ class EventCategoryService:
                         "enabled": enabled
                     })
             
+            self._available_devices_source = ip_data
+            self._available_devices = devices
             return devices
             
         except Exception as e:
             logger.error(f"Ошибка загрузки доступных устройств: {e}")
             return []
     
-    async def get_categories_with_devices(self, session: Session) -> List[EventCategoryWithDevices]:
-        """Получить все категории с устройствами"""
+    def get_categories_with_devices(
+        self, session: Session, with_devices: bool = True
+    ) -> List[EventCategoryWithDevices]:
+        """Получить все категории с устройствами
+
+        Счетчики устройств считаются одним агрегирующим запросом с GROUP BY.
+        При with_devices=False строки устройств не загружаются вовсе.
+        """
         try:
-            categories = session.exec(select(EventCategory)).all()
+            # Только чтение: без autoflush не проверяем identity map перед каждым SELECT
+            with session.no_autoflush:
+                query = select(EventCategory)
+                if with_devices:
+                    # Устройства подгружаются одним дополнительным запросом (selectinload)
+                    query = query.options(selectinload(EventCategory.devices))
+                categories = session.exec(query).all()
+                
+                # category_id -> (включено, всего)
+                counts = {
+                    category_id: (enabled, total)
+                    for category_id, enabled, total in session.exec(
+                        select(
+                            EventDevice.event_category_id,
+                            func.count().filter(EventDevice.is_enabled),
+                            func.count(),
+                        ).group_by(EventDevice.event_category_id)
+                    ).all()
+                }
             
             result = []
             for category in categories:
-                # Получаем устройства для категории
-                devices = session.exec(
-                    select(EventDevice).where(EventDevice.event_category_id == category.id)
-                ).all()
-                
-                enabled_count = sum(1 for device in devices if device.is_enabled)
+                enabled_count, total_count = counts.get(category.id, (0, 0))
                 
                 category_with_devices = EventCategoryWithDevices(
                     id=category.id,
@@ -83,9 +109,9 @@ class EventCategoryService:
                     is_active=category.is_active,
                     created_at=category.created_at,
                     updated_at=category.updated_at,
-                    devices=list(devices),
+                    devices=list(category.devices) if with_devices else [],
                     enabled_devices_count=enabled_count,
-                    total_devices_count=len(devices)
+                    total_devices_count=total_count
                 )
                 result.append(category_with_devices)
             
@@ -98,22 +124,24 @@ class EventCategoryService:
     async def create_category(self, session: Session, name: str, description: str = None) -> EventCategory:
         """Создать новую категорию мероприятия"""
         try:
-            # Проверяем уникальность имени
-            existing = session.exec(
-                select(EventCategory).where(EventCategory.name == name)
-            ).first()
-            
-            if existing:
-                raise ValueError(f"Категория с именем '{name}' уже существует")
-            
             category = EventCategory(
                 name=name,
                 description=description or f"Категория мероприятия: {name}",
                 is_active=True
             )
             
+            # Уникальный индекс по имени появляется только после миграции
+            # 3f7a9b1c5d2e, поэтому на не обновленной БД проверяем явно;
+            # IntegrityError ловит гонку двух одновременных запросов
+            if session.scalar(select(exists().where(EventCategory.name == name))):
+                raise ValueError(f"Категория с именем '{name}' уже существует")
+            
             session.add(category)
-            session.commit()
+            try:
+                session.commit()
+            except IntegrityError:
+                session.rollback()
+                raise ValueError(f"Категория с именем '{name}' уже существует")
             session.refresh(category)
             
             # Отправляем событие
@@ -145,15 +173,16 @@ class EventCategoryService:
             
             # Обновляем поля
             if name is not None:
-                # Проверяем уникальность нового имени
-                existing = session.exec(
-                    select(EventCategory).where(
+                # Проверяем уникальность нового имени до запуска/остановки
+                # мониторинга ниже; SELECT EXISTS без загрузки строки
+                name_taken = session.scalar(
+                    select(exists().where(
                         EventCategory.name == name,
                         EventCategory.id != category_id
-                    )
-                ).first()
+                    ))
+                )
                 
-                if existing:
+                if name_taken:
                     raise ValueError(f"Категория с именем '{name}' уже существует")
                 
                 category.name = name
@@ -172,7 +201,8 @@ class EventCategoryService:
                 elif not old_active and is_active:
                     await self.start_category_monitoring(session, category_id)
             
-            category.updated_at = datetime.utcnow()
+            now = datetime.utcnow()
+            category.updated_at = now
             
             session.add(category)
             session.commit()
@@ -186,7 +216,7 @@ class EventCategoryService:
                     "name": category.name,
                     "description": category.description,
                     "is_active": category.is_active,
-                    "timestamp": datetime.utcnow().isoformat()
+                    "timestamp": now.isoformat()
                 }
             })
             
@@ -207,13 +237,10 @@ class EventCategoryService:
             # Останавливаем мониторинг категории
             await self.stop_category_monitoring(category_id)
             
-            # Удаляем связанные устройства
-            devices = session.exec(
-                select(EventDevice).where(EventDevice.event_category_id == category_id)
-            ).all()
-            
-            for device in devices:
-                session.delete(device)
+            # Удаляем связанные устройства одним DELETE
+            devices_count = session.execute(
+                delete(EventDevice).where(EventDevice.event_category_id == category_id)
+            ).rowcount
             
             # Удаляем категорию
             category_name = category.name
@@ -226,7 +253,7 @@ class EventCategoryService:
                 "data": {
                     "category_id": category_id,
                     "name": category_name,
-                    "devices_count": len(devices),
+                    "devices_count": devices_count,
                     "timestamp": datetime.utcnow().isoformat()
                 }
             })
@@ -246,30 +273,40 @@ class EventCategoryService:
             if not category:
                 raise ValueError(f"Категория с ID {category_id} не найдена")
             
-            # Удаляем существующие устройства
-            existing_devices = session.exec(
-                select(EventDevice).where(EventDevice.event_category_id == category_id)
-            ).all()
-            
-            for device in existing_devices:
-                session.delete(device)
-            
-            # Добавляем новые устройства
-            added_count = 0
-            for device_update in device_updates:
-                event_device = EventDevice(
-                    event_category_id=category_id,
-                    device_id=device_update["device_id"],
-                    is_enabled=device_update.get("is_enabled", True)
-                )
-                session.add(event_device)
-                added_count += 1
+            # Заменяем устройства категории: один DELETE и один пакетный INSERT
+            session.execute(
+                delete(EventDevice).where(EventDevice.event_category_id == category_id)
+            )
+            
+            # Пара категория+устройство уникальна, при повторах в запросе
+            # побеждает последняя запись
+            unique_updates = {
+                device_update["device_id"]: device_update
+                for device_update in device_updates
+            }
+            now = datetime.utcnow()
+            rows = [
+                {
+                    "event_category_id": category_id,
+                    "device_id": device_id,
+                    "is_enabled": device_update.get("is_enabled", True),
+                    "created_at": now,
+                }
+                for device_id, device_update in unique_updates.items()
+            ]
+            if rows:
+                session.execute(insert(EventDevice), rows)
+            added_count = len(rows)
             
             session.commit()
             
             # Перезапускаем мониторинг категории если она активна
             if category.is_active:
-                await self.restart_category_monitoring(session, category_id)
+                # Новый список устройств известен - не перечитываем его из БД
+                await self.restart_category_monitoring(
+                    session, category_id,
+                    device_ids=[row["device_id"] for row in rows if row["is_enabled"]]
+                )
             
             # Отправляем событие
             await event_manager.publish({
@@ -278,7 +315,7 @@ class EventCategoryService:
                     "category_id": category_id,
                     "category_name": category.name,
                     "devices_count": added_count,
-                    "timestamp": datetime.utcnow().isoformat()
+                    "timestamp": now.isoformat()
                 }
             })
             
@@ -289,34 +326,37 @@ class EventCategoryService:
             logger.error(f"Ошибка обновления устройств категории: {e}")
             raise
     
-    async def start_category_monitoring(self, session: Session, category_id: int) -> bool:
-        """Запустить мониторинг категории"""
+    async def start_category_monitoring(self, session: Session, category_id: int,
+                                        device_ids: Optional[List[str]] = None) -> bool:
+        """Запустить мониторинг категории
+
+        device_ids - уже известный список включенных устройств; если передан,
+        устройства категории из БД не читаются.
+        """
         try:
             category = session.get(EventCategory, category_id)
             if not category or not category.is_active:
                 return False
             
-            # Получаем устройства категории
-            devices = session.exec(
-                select(EventDevice).where(
-                    EventDevice.event_category_id == category_id,
-                    EventDevice.is_enabled == True
-                )
-            ).all()
+            if device_ids is None:
+                # Устройства берем через relationship: если они уже подгружены
+                # (selectinload в initialize_active_categories), запроса не будет
+                device_ids = [device.device_id for device in category.devices if device.is_enabled]
             
-            if not devices:
+            if not device_ids:
                 logger.warning(f"В категории {category.name} нет активных устройств для мониторинга")
                 return False
             
-            device_ids = [device.device_id for device in devices]
             self.category_monitors[category_id] = device_ids
             
+            now_iso = datetime.utcnow().isoformat()
+            
             # Добавляем в активные категории
             self.active_categories[category_id] = {
                 "name": category.name,
                 "description": category.description,
                 "device_count": len(device_ids),
-                "started_at": datetime.utcnow().isoformat()
+                "started_at": now_iso
             }
             
             # Отправляем событие
@@ -327,7 +367,7 @@ class EventCategoryService:
                     "category_name": category.name,
                     "devices_count": len(device_ids),
                     "device_ids": device_ids,
-                    "timestamp": datetime.utcnow().isoformat()
+                    "timestamp": now_iso
                 }
             })
             
@@ -365,22 +405,25 @@ class EventCategoryService:
             logger.error(f"Ошибка остановки мониторинга категории: {e}")
             return False
     
-    async def restart_category_monitoring(self, session: Session, category_id: int) -> bool:
+    async def restart_category_monitoring(self, session: Session, category_id: int,
+                                          device_ids: Optional[List[str]] = None) -> bool:
         """Перезапустить мониторинг категории"""
         await self.stop_category_monitoring(category_id)
-        return await self.start_category_monitoring(session, category_id)
+        return await self.start_category_monitoring(session, category_id, device_ids)
     
     async def get_category_statistics(self, session: Session, category_id: int) -> Dict[str, Any]:
         """Получить статистику по категории"""
         try:
-            category = session.get(EventCategory, category_id)
-            if not category:
-                raise ValueError(f"Категория с ID {category_id} не найдена")
-            
-            # Получаем устройства категории
-            devices = session.exec(
-                select(EventDevice).where(EventDevice.event_category_id == category_id)
-            ).all()
+            # Только чтение: без autoflush не проверяем identity map перед каждым SELECT
+            with session.no_autoflush:
+                category = session.get(EventCategory, category_id)
+                if not category:
+                    raise ValueError(f"Категория с ID {category_id} не найдена")
+                
+                # Получаем устройства категории
+                devices = session.exec(
+                    select(EventDevice).where(EventDevice.event_category_id == category_id)
+                ).all()
             
             # Получаем статусы устройств из мониторинга
             monitoring_status = monitoring_service.get_status()
@@ -448,13 +491,20 @@ class EventCategoryService:
         """Инициализировать активные категории при запуске"""
         try:
             with next(get_session()) as session:
-                # Получаем все активные категории
+                # Получаем все активные категории вместе с устройствами:
+                # два запроса вместо двух на каждую категорию
                 active_categories = session.exec(
-                    select(EventCategory).where(EventCategory.is_active == True)
+                    select(EventCategory)
+                    .where(EventCategory.is_active == True)
+                    .options(selectinload(EventCategory.devices))
                 ).all()
                 
-                for category in active_categories:
-                    await self.start_category_monitoring(session, category.id)
+                # Устройства уже подгружены, start_category_monitoring не ходит
+                # в БД между await - запускаем категории одновременно
+                await asyncio.gather(*(
+                    self.start_category_monitoring(session, category.id)
+                    for category in active_categories
+                ))
                 
                 logger.info(f"Инициализировано {len(active_categories)} активных категорий мониторинга")
                 
@@ -4,24 +4,97 @@
 """
 
 import asyncio
-import json
 import logging
+import random
+from collections import Counter
+from dataclasses import dataclass
 from datetime import datetime, timedelta
 from pathlib import Path
+from time import monotonic, perf_counter_ns
 from typing import Dict, List, Optional, Tuple
-from icmplib import ping as icmp_ping
+from icmplib import async_multiping, async_ping
 
+from ..utils.config_files import read_json_cached
 from ..utils.events_bus import event_manager, device_event_manager
-from ..core.db import get_session
+from ..core.db import engine
 from ..models.device import Device
+from sqlalchemy import event, func, update
 from sqlmodel import Session, select
 
 logger = logging.getLogger(__name__)
 
+# Ключ в Session.info: после commit нужно перезагрузить конфигурацию мониторинга
+RELOAD_AFTER_COMMIT_KEY = "needs_monitoring_reload"
+
+BASE_DIR = Path(__file__).parent.parent.parent.parent
+CONFIG_PATH = BASE_DIR / "config.json"
+IP_LIST_PATH = BASE_DIR / "IP_list.json"
+
+# Ограничение параллельных ICMP-запросов в async_multiping
+MAX_CONCURRENT_PINGS = 256
+
+# Сколько необработанных циклов пинга может ждать записи в БД и отправки событий
+CYCLE_QUEUE_SIZE = 4
+
+# Без смены статуса строка устройства перезаписывается не чаще чем раз в
+# столько секунд - только чтобы обновить last_check и response_ms
+LAST_CHECK_PERSIST_INTERVAL = timedelta(seconds=60)
+
+# ...или раньше, если время отклика изменилось больше чем на эту долю
+RESPONSE_CHANGE_TOLERANCE = 0.1
+
+# Кольцо последних результатов пинга для гистерезиса (бит 0 - последний)
+HISTORY_SIZE = 16
+HISTORY_MASK = (1 << HISTORY_SIZE) - 1
+
+
+def _response_close(old: Optional[int], new: Optional[int]) -> bool:
+    """Время отклика не изменилось заметно для записи в БД"""
+    if old is None or new is None:
+        return old is new
+    return abs(new - old) <= old * RESPONSE_CHANGE_TOLERANCE
+
+
+@dataclass(slots=True)
+class PingResult:
+    """Результат пинга устройства за цикл мониторинга
+
+    В JSON (SSE, ответы API) сериализуется как dict - orjson и FastAPI
+    поддерживают dataclass напрямую.
+    """
+    device_id: str
+    ip: str
+    status: str
+    response_time: Optional[int]
+    timestamp: datetime
+    consecutive_failures: int
+    consecutive_successes: int
+    error: Optional[str] = None
+
 
 class DeviceMonitor:
     """Монитор отдельного устройства с улучшенной детекцией изменений"""
     
+    # Мониторов сотни, а набор полей фиксирован - без __dict__ на каждый объект
+    __slots__ = (
+        "device_id", "ip", "description", "current_status", "last_check",
+        "response_time", "_history", "_samples", "stable_status",
+        "interval", "next_due",
+    )
+    
+    # Гистерезис уведомлений: сколько последних пингов подряд должны
+    # совпасть, чтобы устойчивый статус сменился
+    enter_offline_threshold = 3
+    enter_online_threshold = 2
+    
+    # Адаптивный интервал: после стольких успешных пингов подряд интервал
+    # устойчиво доступного устройства удваивается (до max_interval секунд);
+    # любая неудача возвращает базовый. Разброс +-interval_jitter разводит
+    # пинги устройств во времени
+    backoff_after_successes = 5
+    max_interval = 300
+    interval_jitter = 0.2
+    
     def __init__(self, device_id: str, ip: str, description: str = ""):
         self.device_id = device_id
         self.ip = ip
@@ -29,124 +102,150 @@ class DeviceMonitor:
         self.current_status = "unknown"
         self.last_check = None
         self.response_time = None
-        self.consecutive_failures = 0
-        self.consecutive_successes = 0
         
-        # Улучшенная детекция изменений (debounce/hysteresis)
-        self.last_status_change = None
-        self.status_change_min_interval = 60  # Минимум 60 секунд между уведомлениями
-        self.flapping_detection = False  # Детекция нестабильного устройства
+        # История результатов (1 - ответил) и число накопленных отсчетов
+        self._history = 0
+        self._samples = 0
+        # Устойчивый статус, по смене которого отправляются уведомления
+        self.stable_status = "unknown"
+        
+        # Текущий интервал пинга и время следующего (time.monotonic);
+        # новый монитор пингуется в ближайшем цикле
+        self.interval = 0.0
+        self.next_due = 0.0
+    
+    @property
+    def consecutive_successes(self) -> int:
+        """Успешные пинги подряд (в пределах окна HISTORY_SIZE)"""
+        run = (self._history ^ (self._history + 1)).bit_length() - 1
+        return min(run, self._samples)
+    
+    @property
+    def consecutive_failures(self) -> int:
+        """Неудачные пинги подряд (в пределах окна HISTORY_SIZE)"""
+        if self._history == 0:
+            return self._samples
+        run = (self._history & -self._history).bit_length() - 1
+        return min(run, self._samples)
+    
+    def _push_sample(self, alive: bool):
+        """Добавить результат пинга в кольцо истории"""
+        self._history = ((self._history << 1) | alive) & HISTORY_MASK
+        if self._samples < HISTORY_SIZE:
+            self._samples += 1
+    
+    def _next_stable_status(self) -> str:
+        """Устойчивый статус по последним отсчетам истории
+
+        Из "error" устройство выходит сразу по первому ответу пинга (как и
+        входит в него), без гистерезиса.
+        """
+        if self.stable_status == "error":
+            return "online" if self._history & 1 else "offline"
+        online_mask = (1 << self.enter_online_threshold) - 1
+        offline_mask = (1 << self.enter_offline_threshold) - 1
+        if (self.stable_status != "online"
+                and self._samples >= self.enter_online_threshold
+                and self._history & online_mask == online_mask):
+            return "online"
+        if (self.stable_status != "offline"
+                and self._samples >= self.enter_offline_threshold
+                and self._history & offline_mask == 0):
+            return "offline"
+        return self.stable_status
         
-    async def ping(self) -> Dict[str, any]:
+    async def ping(self, changes: list, now: Optional[datetime] = None) -> PingResult:
         """Выполнить пинг устройства"""
         try:
-            # Выполняем пинг в отдельном потоке
-            loop = asyncio.get_running_loop()
-            result = await loop.run_in_executor(
-                None, 
-                lambda: icmp_ping(self.ip, count=1, timeout=3)
-            )
-            
+            # Асинхронный ping icmplib прямо в event loop, без пула потоков
+            result = await async_ping(self.ip, count=1, timeout=3)
+        except Exception as e:
+            return self.record_error(e, changes, now)
+        return self.update_from_result(result, changes, now)
+    
+    def schedule(self, now: float, base_interval: float):
+        """Запланировать следующий пинг устройства"""
+        if (self.stable_status == "online"
+                and self.consecutive_successes >= self.backoff_after_successes):
+            self.interval = max(base_interval, min(self.interval * 2, self.max_interval))
+        else:
+            self.interval = base_interval
+        jitter = self.interval_jitter
+        self.next_due = now + self.interval * random.uniform(1 - jitter, 1 + jitter)
+    
+    def _status_change(self, old_status: str, new_status: str) -> Dict[str, any]:
+        """Переход статуса для DeviceEventManager.status_changes"""
+        return {
+            "device_id": self.device_id,
+            "ip": self.ip,
+            "old_status": old_status,
+            "new_status": new_status,
+            "response_time": self.response_time,
+        }
+    
+    def update_from_result(self, result, changes: list, now: Optional[datetime] = None) -> PingResult:
+        """Обновить состояние по результату пинга (icmplib Host)
+
+        Используется и одиночным ping, и пакетным пингом всех устройств в
+        MonitoringService.
+        """
+        try:
             is_alive = getattr(result, 'is_alive', False)
             avg_rtt = getattr(result, 'avg_rtt', None)
-            
-            old_status = self.current_status
-            new_status = "online" if is_alive else "offline"
-            
-            # Обновляем состояние
-            self.last_check = datetime.utcnow()
-            self.response_time = int(avg_rtt * 1000) if avg_rtt else None
-            
-            # Подсчитываем последовательные сбои/успехи
-            if new_status == "online":
-                self.consecutive_failures = 0
-                self.consecutive_successes += 1
-            else:
-                self.consecutive_successes = 0
-                self.consecutive_failures += 1
-            
-            # Детекция flapping (нестабильное устройство)
-            if self.consecutive_failures > 0 and self.consecutive_successes > 0:
-                if self.consecutive_failures + self.consecutive_successes > 10:
-                    self.flapping_detection = True
-                    logger.warning(
-                        f"Устройство {self.device_id} нестабильно (flapping), "
-                        f"уведомления приглушены"
-                    )
-            else:
-                self.flapping_detection = False
-            
-            # УЛУЧШЕННАЯ ЛОГИКА: уведомляем только при значимых изменениях
-            should_notify = False
-            now = datetime.utcnow()
-            
-            if old_status != new_status and old_status != "unknown":
-                # Проверяем минимальный интервал между уведомлениями
-                if self.last_status_change is None:
-                    should_notify = True
-                else:
-                    time_since_last_change = (now - self.last_status_change).total_seconds()
-                    if time_since_last_change >= self.status_change_min_interval:
-                        should_notify = True
-                    else:
-                        logger.debug(
-                            f"Устройство {self.device_id}: изменение статуса подавлено "
-                            f"(debounce {time_since_last_change:.0f}s < {self.status_change_min_interval}s)"
-                        )
-                
-                # Для flapping устройств уведомляем только после стабилизации
-                if self.flapping_detection:
-                    if self.consecutive_failures >= 5 or self.consecutive_successes >= 5:
-                        should_notify = True
-                        self.flapping_detection = False
-                    else:
-                        should_notify = False
-                
-                if should_notify:
-                    await device_event_manager.device_status_changed(
-                        self.device_id, old_status, new_status, 
-                        self.ip, self.response_time
-                    )
-                    self.last_status_change = now
-                    logger.info(f"Устройство {self.device_id} ({self.ip}): {old_status} -> {new_status}")
-            
-            self.current_status = new_status
-            
-            return {
-                "device_id": self.device_id,
-                "ip": self.ip,
-                "status": new_status,
-                "response_time": self.response_time,
-                "timestamp": self.last_check.isoformat(),
-                "consecutive_failures": self.consecutive_failures,
-                "consecutive_successes": self.consecutive_successes
-            }
-            
+            return self._apply_status(
+                "online" if is_alive else "offline",
+                int(avg_rtt * 1000) if avg_rtt else None,
+                changes, now
+            )
         except Exception as e:
-            logger.error(f"Ошибка пинга устройства {self.device_id} ({self.ip}): {e}")
-            
-            old_status = self.current_status
-            self.current_status = "error"
-            self.last_check = datetime.utcnow()
-            self.response_time = None
-            self.consecutive_failures += 1
-            self.consecutive_successes = 0
-            
-            if old_status != "error" and old_status != "unknown":
-                await device_event_manager.device_status_changed(
-                    self.device_id, old_status, "error", self.ip, None
-                )
-            
-            return {
-                "device_id": self.device_id,
-                "ip": self.ip,
-                "status": "error",
-                "response_time": None,
-                "timestamp": self.last_check.isoformat(),
-                "error": str(e),
-                "consecutive_failures": self.consecutive_failures,
-                "consecutive_successes": self.consecutive_successes
-            }
+            return self.record_error(e, changes, now)
+    
+    def record_error(self, e: Exception, changes: list, now: Optional[datetime] = None) -> PingResult:
+        """Зафиксировать ошибку пинга устройства"""
+        logger.error("Ошибка пинга устройства %s (%s): %s", self.device_id, self.ip, e)
+        return self._apply_status("error", None, changes, now, error=str(e))
+    
+    def _apply_status(self, new_status: str, response_time: Optional[int], changes: list,
+                      now: Optional[datetime] = None, error: Optional[str] = None) -> PingResult:
+        """Применить результат пинга: история, гистерезис уведомлений
+
+        Смена статуса добавляется в changes - события по ним отправляются
+        одним пакетом в конце цикла. now - общее время цикла; timestamp в
+        результате остается datetime, в ISO строку его переводит только
+        JSON-кодирование (orjson/FastAPI).
+        """
+        self.current_status = new_status
+        self.last_check = now or datetime.utcnow()
+        self.response_time = response_time
+        self._push_sample(new_status == "online")
+        
+        old_stable = self.stable_status
+        if new_status == "error":
+            # Ошибка самого пинга сообщается сразу, без гистерезиса; устойчивый
+            # статус становится "error", чтобы после нее пришло восстановление
+            if old_stable not in ("error", "unknown"):
+                self.stable_status = "error"
+                changes.append(self._status_change(old_stable, "error"))
+        else:
+            # Уведомляем только при смене устойчивого статуса: нестабильное
+            # устройство не набирает нужного числа одинаковых пингов подряд
+            new_stable = self._next_stable_status()
+            if new_stable != old_stable:
+                self.stable_status = new_stable
+                if old_stable != "unknown":
+                    changes.append(self._status_change(old_stable, new_stable))
+                    logger.info("Устройство %s (%s): %s -> %s", self.device_id, self.ip, old_stable, new_stable)
+        
+        return PingResult(
+            device_id=self.device_id,
+            ip=self.ip,
+            status=new_status,
+            response_time=response_time,
+            timestamp=self.last_check,
+            consecutive_failures=self.consecutive_failures,
+            consecutive_successes=self.consecutive_successes,
+            error=error
+        )
 
 
 class MonitoringService:
@@ -156,9 +255,31 @@ class MonitoringService:
         self.monitors: Dict[str, DeviceMonitor] = {}
         self.is_running = False
         self.monitoring_task: Optional[asyncio.Task] = None
+        self.consumer_task: Optional[asyncio.Task] = None
+        # Результаты циклов пинга: (valid_results, changes, ping_duration)
+        self._cycle_queue: Optional[asyncio.Queue] = None
         self.ping_interval = 30  # секунд
         self.config_check_interval = 300  # 5 минут
         self.last_config_check = None
+        # То же время по time.monotonic - для расписания, не зависит от
+        # перевода системных часов
+        self._last_config_check_mono: Optional[float] = None
+        self.reload_debounce = 0.5  # секунд
+        self._reload_task: Optional[asyncio.Task] = None
+        # Запрос пришел после того, как _debounced_reload начал ждать
+        self._reload_pending = False
+        # (count, max(updated_at)) по таблице устройств -> список устройств;
+        # updated_at меняется только при изменении конфигурации устройства
+        self._devices_cache: Tuple[Optional[tuple], List[Tuple[str, str, str]]] = (None, [])
+        # Список, из которого собраны текущие мониторы
+        self._monitored_devices: Optional[List[Tuple[str, str, str]]] = None
+        # device_id -> (id, status, response_ms, last_check) последней известной
+        # записи в БД; заполняется при загрузке списка устройств и после каждой
+        # записи статусов
+        self._device_rows: Dict[str, Tuple[int, Optional[str], Optional[int], Optional[datetime]]] = {}
+        # Снимок состояний мониторов для get_status; сбрасывается после
+        # каждого пинга и при пересборке мониторов
+        self._monitors_snapshot: Optional[Dict[str, Dict[str, any]]] = None
         
     def _load_devices_from_config(self) -> List[Tuple[str, str, str]]:
         """Загрузить устройства из базы данных"""
@@ -166,14 +287,28 @@ class MonitoringService:
             devices = []
             
             # Читаем устройства из БД
-            with next(get_session()) as session:
+            with Session(engine) as session:
+                # Дешевая проверка свежести: список перечитываем только если
+                # устройства добавлялись, удалялись или менялись
+                sentinel = tuple(session.exec(
+                    select(func.count(Device.id), func.max(Device.updated_at))
+                ).one())
+                if sentinel == self._devices_cache[0]:
+                    return self._devices_cache[1]
+                
                 db_devices = session.exec(
                     select(Device).where(Device.enabled == True)
                 ).all()
                 
+                device_rows = {}
                 for device in db_devices:
                     devices.append((device.device_id, device.ip, device.description or ""))
+                    device_rows[device.device_id] = (
+                        device.id, device.status, device.response_ms, device.last_check
+                    )
             
+            self._devices_cache = (sentinel, devices)
+            self._device_rows = device_rows
             logger.info(f"Загружено {len(devices)} активных устройств из БД")
             return devices
             
@@ -186,15 +321,11 @@ class MonitoringService:
     def _load_devices_from_json_fallback(self) -> List[Tuple[str, str, str]]:
         """Fallback: загрузить устройства из IP_list.json если БД недоступна"""
         try:
-            BASE_DIR = Path(__file__).parent.parent.parent.parent
-            ip_list_path = BASE_DIR / "IP_list.json"
-            
-            if not ip_list_path.exists():
+            if not IP_LIST_PATH.exists():
                 logger.warning("IP_list.json не найден")
                 return []
             
-            with open(ip_list_path, 'r', encoding='utf-8') as f:
-                ip_data = json.load(f)
+            ip_data = read_json_cached(IP_LIST_PATH)
             
             devices = []
             for device_id, device_info in ip_data.items():
@@ -219,16 +350,63 @@ class MonitoringService:
             logger.error(f"Ошибка fallback загрузки из JSON: {e}")
             return []
     
+    def _create_missing_devices(self, devices: List[Tuple[str, str, str]]):
+        """Создать в БД строки для мониторируемых устройств, которых там нет
+
+        Нужно только когда список пришел из IP_list.json: устройства из БД
+        уже есть в _device_rows. Заодно в _device_rows попадают найденные
+        в БД строки, чтобы статусы этих устройств записывались.
+        """
+        missing = {
+            device_id: (ip, description)
+            for device_id, ip, description in devices
+            if device_id not in self._device_rows
+        }
+        if not missing:
+            return
+        
+        try:
+            with Session(engine) as session:
+                rows = {}
+                for device_id, pk, status, response_ms, last_check in session.exec(
+                    select(Device.device_id, Device.id, Device.status, Device.response_ms, Device.last_check)
+                    .where(Device.device_id.in_(list(missing)))
+                ).all():
+                    rows[device_id] = (pk, status, response_ms, last_check)
+                
+                devices_to_create = [
+                    Device(
+                        device_id=device_id,
+                        ip=ip,
+                        description=description or "Автоматически добавлено из мониторинга",
+                        category="Турникет",
+                        enabled=True
+                    )
+                    for device_id, (ip, description) in missing.items()
+                    if device_id not in rows
+                ]
+                if devices_to_create:
+                    session.add_all(devices_to_create)
+                    session.flush()  # id новых устройств до commit
+                    for device in devices_to_create:
+                        rows[device.device_id] = (
+                            device.id, device.status, device.response_ms, device.last_check
+                        )
+                    session.commit()
+                    logger.info(f"Создано {len(devices_to_create)} устройств в БД из мониторинга")
+            
+            self._device_rows.update(rows)
+            
+        except Exception as e:
+            logger.error(f"Ошибка создания устройств в БД: {e}")
+    
     def _load_ping_interval(self) -> int:
         """Загрузить интервал пинга из config.json"""
         try:
-            BASE_DIR = Path(__file__).parent.parent.parent.parent
-            config_path = BASE_DIR / "config.json"
+            # Кэш по mtime: файл разбирается заново только после изменения
+            config = read_json_cached(CONFIG_PATH)
             
-            if config_path.exists():
-                with open(config_path, 'r', encoding='utf-8') as f:
-                    config = json.load(f)
-                
+            if config:
                 time_connect = config.get("time_connect", 30)
                 if isinstance(time_connect, str):
                     time_connect = int(time_connect)
@@ -240,171 +418,263 @@ class MonitoringService:
         
         return 30  # По умолчанию 30 секунд
     
-    async def _update_database_status(self, results: List[Dict[str, any]]):
-        """Обновить статусы в базе данных (BATCH режим)"""
+    async def _update_database_status(self, results: List[PingResult], full: bool = True):
+        """Обновить статусы в базе данных, не блокируя event loop
+
+        Синхронная работа с SQLite выполняется в потоке, пинги и отправка
+        событий в это время продолжаются.
+        """
+        if results:
+            await asyncio.to_thread(self._update_database_status_sync, results, full)
+    
+    def _update_database_status_sync(self, results: List[PingResult], full: bool = True):
+        """Обновить статусы в базе данных (BATCH режим)
+
+        При full=False записываются только устройства, у которых сменился
+        status или заметно (RESPONSE_CHANGE_TOLERANCE) изменился response_ms,
+        а без изменений - если last_check в БД старше LAST_CHECK_PERSIST_INTERVAL.
+        """
         if not results:
             return
             
         try:
             # Используем контекстный менеджер для сессии
-            with next(get_session()) as session:
-                # PHASE 1: Загружаем все устройства одним запросом
-                device_ids = [r["device_id"] for r in results]
-                existing_devices = session.exec(
-                    select(Device).where(Device.device_id.in_(device_ids))
-                ).all()
-                
-                # Создаём словарь для быстрого доступа
-                devices_map = {device.device_id: device for device in existing_devices}
+            with Session(engine) as session:
+                # PHASE 1: Ключи и последние записанные статусы берем из
+                # памяти - SELECT по списку device_id не нужен
+                db_rows = self._device_rows
                 
-                # PHASE 2: Обновляем устройства в памяти
-                devices_to_update = []
-                devices_to_create = []
-                now = datetime.utcnow()
+                # PHASE 2: Готовим строки для UPDATE
+                mappings = []
+                written = {}
                 
                 for result in results:
-                    device_id = result["device_id"]
-                    timestamp = datetime.fromisoformat(result["timestamp"].replace('Z', '+00:00'))
+                    device_id = result.device_id
+                    timestamp = result.timestamp
                     
-                    if device_id in devices_map:
-                        # Обновляем существующее устройство
-                        device = devices_map[device_id]
-                        device.status = result["status"]
-                        device.response_ms = result["response_time"]
-                        device.last_check = timestamp
-                        device.updated_at = now
-                        devices_to_update.append(device)
-                    else:
-                        # Создаем новое устройство
-                        device = Device(
-                            device_id=device_id,
-                            ip=result["ip"],
-                            description=f"Автоматически добавлено из мониторинга",
-                            category="Турникет",
-                            status=result["status"],
-                            response_ms=result["response_time"],
-                            last_check=timestamp,
-                            enabled=True
-                        )
-                        devices_to_create.append(device)
+                    row = db_rows.get(device_id)
+                    if row is None:
+                        # Строки создает _create_missing_devices при загрузке
+                        # конфигурации; здесь только обновление
+                        logger.error("Устройство %s отсутствует в БД, статус не записан", device_id)
+                        continue
+                    
+                    pk, status, response_ms, last_check = row
+                    if (not full and status == result.status
+                            and _response_close(response_ms, result.response_time)
+                            and last_check is not None
+                            and timestamp - last_check < LAST_CHECK_PERSIST_INTERVAL):
+                        continue
+                    written[device_id] = (pk, result.status, result.response_time, timestamp)
+                    mappings.append({
+                        "id": pk,
+                        "status": result.status,
+                        "response_ms": result.response_time,
+                        "last_check": timestamp,
+                    })
                 
-                # PHASE 3: Batch commit - одна транзакция
-                for device in devices_to_update:
-                    session.add(device)
-                for device in devices_to_create:
-                    session.add(device)
+                if not mappings:
+                    return
                 
+                # PHASE 3: Один executemany UPDATE по первичному ключу вместо
+                # flush N объектов
+                session.execute(update(Device), mappings)
                 session.commit()
                 
-                logger.debug(
-                    f"БД обновлена (batch): {len(devices_to_update)} обновлено, "
-                    f"{len(devices_to_create)} создано"
-                )
+                # Следующий цикл сравнивает статусы с только что записанными
+                db_rows.update(written)
+                
+                logger.debug("БД обновлена (batch): %d обновлено", len(mappings))
                 
         except Exception as e:
             logger.error(f"Ошибка batch обновления БД: {e}")
     
     async def _monitoring_loop(self):
         """
-        Основной цикл мониторинга с разделением на фазы:
-        PHASE 1: Параллельный ping всех устройств
-        PHASE 2: Batch update БД
-        PHASE 3: Синхронизация мониторов
-        PHASE 4: Emit SSE events
+        Основной цикл мониторинга (производитель):
+        PHASE 1: Параллельный ping всех устройств (он же обновляет
+        состояния мониторов)
+
+        Результаты цикла передаются через ограниченную очередь в
+        _consumer_loop, поэтому медленная запись в БД не задерживает
+        следующий пинг.
         """
         logger.info("Запуск цикла мониторинга (оптимизированный)")
         
         while self.is_running:
             try:
                 # Проверяем конфигурацию периодически
-                now = datetime.utcnow()
-                if (self.last_config_check is None or 
-                    now - self.last_config_check > timedelta(seconds=self.config_check_interval)):
+                now_mono = monotonic()
+                if (self._last_config_check_mono is None or 
+                    now_mono - self._last_config_check_mono > self.config_check_interval):
                     
                     await self._reload_configuration()
-                    self.last_config_check = now
+                    self._last_config_check_mono = now_mono
+                    self.last_config_check = datetime.utcnow()
                 
                 if not self.monitors:
                     await asyncio.sleep(self.ping_interval)
                     continue
                 
+                # Никто не слушает события (ни SSE клиенты, ни бот) - не пингуем.
+                # Ждем не дольше интервала, чтобы проверка конфигурации
+                # продолжала выполняться; новый подписчик будит цикл сразу
+                if not await event_manager.wait_for_subscribers(self.ping_interval):
+                    continue
+                
+                # Один цикл раз в ping_interval. У каждого устройства свой срок
+                # следующего пинга; в цикл попадают все, чей срок наступает до
+                # середины следующего интервала - так устройства пингуются
+                # одним multiping и дают одно событие на цикл
+                cycle_start = monotonic()
+                window_end = cycle_start + self.ping_interval / 2
+                due = [monitor for monitor in self.monitors.values() if monitor.next_due <= window_end]
+                if not due:
+                    await asyncio.sleep(self._next_cycle_delay(cycle_start))
+                    continue
+                
                 # ============ PHASE 1: Параллельный ping ============
-                logger.debug(f"Phase 1: Пинг {len(self.monitors)} устройств...")
-                ping_start = asyncio.get_event_loop().time()
+                logger.debug("Phase 1: Пинг %d из %d устройств...", len(due), len(self.monitors))
+                ping_start = perf_counter_ns()
+                
+                # Одно время проверки на весь цикл
+                results, changes = await self._ping_all_async(datetime.utcnow(), due)
                 
-                ping_tasks = [monitor.ping() for monitor in self.monitors.values()]
-                results = await asyncio.gather(*ping_tasks, return_exceptions=True)
+                ping_duration = (perf_counter_ns() - ping_start) / 1e9
                 
-                ping_duration = asyncio.get_event_loop().time() - ping_start
+                for monitor in due:
+                    monitor.schedule(cycle_start, self.ping_interval)
                 
                 # Фильтруем успешные результаты
                 valid_results = []
                 errors_count = 0
                 for result in results:
-                    if isinstance(result, dict):
+                    if isinstance(result, PingResult):
                         valid_results.append(result)
                     else:
                         errors_count += 1
-                        logger.error(f"Ошибка пинга: {result}")
+                        logger.error("Ошибка пинга: %s", result)
                 
                 if not valid_results:
                     logger.warning("Нет валидных результатов пинга")
-                    await asyncio.sleep(self.ping_interval)
+                    await asyncio.sleep(self._next_cycle_delay(cycle_start))
                     continue
                 
-                # ============ PHASE 2: Batch update БД ============
-                logger.debug(f"Phase 2: Batch обновление БД ({len(valid_results)} устройств)...")
-                db_start = asyncio.get_event_loop().time()
+                # Потребитель не успевает - выбрасываем самый старый цикл:
+                # свежие статусы важнее полноты истории. Смены статусов не
+                # теряем - по ним бот отправляет уведомления
+                if self._cycle_queue.full():
+                    _, dropped_changes, _ = self._cycle_queue.get_nowait()
+                    changes = dropped_changes + changes
+                    logger.warning("Очередь циклов мониторинга переполнена, старый цикл пропущен")
+                self._cycle_queue.put_nowait((valid_results, changes, ping_duration))
                 
-                await self._update_database_status(valid_results)
+                # Ждем следующего цикла
+                await asyncio.sleep(self._next_cycle_delay(cycle_start))
                 
-                db_duration = asyncio.get_event_loop().time() - db_start
+            except asyncio.CancelledError:
+                logger.info("Цикл мониторинга отменен")
+                break
+            except Exception as e:
+                logger.error(f"Ошибка в цикле мониторинга: {e}", exc_info=True)
+                await asyncio.sleep(5)  # Короткая пауза при ошибке
+        
+        logger.info("Цикл мониторинга завершен")
+    
+    def _next_cycle_delay(self, cycle_start: float) -> float:
+        """Пауза до начала следующего цикла (cycle_start + ping_interval)"""
+        return max(cycle_start + self.ping_interval - monotonic(), 0.0)
+    
+    async def _consumer_loop(self):
+        """
+        Обработка результатов циклов мониторинга (потребитель):
+        PHASE 2: Batch update БД
+        PHASE 3: Emit SSE events
+        """
+        while True:
+            try:
+                valid_results, changes, ping_duration = await self._cycle_queue.get()
                 
-                # ============ PHASE 3: Синхронизация мониторов ============
-                logger.debug("Phase 3: Синхронизация состояний мониторов...")
+                # ============ PHASE 2: Batch update БД ============
+                logger.debug("Phase 2: Batch обновление БД (%d устройств)...", len(valid_results))
+                db_start = perf_counter_ns()
                 
-                # Обновляем internal state мониторов на основе результатов
-                for result in valid_results:
-                    device_id = result["device_id"]
-                    if device_id in self.monitors:
-                        monitor = self.monitors[device_id]
-                        # State уже обновлён в monitor.ping(), просто логируем
+                # Сразу пишем только смены статуса, остальное - раз в минуту
+                await self._update_database_status(valid_results, full=False)
                 
-                # ============ PHASE 4: Emit events ============
-                logger.debug("Phase 4: Отправка SSE событий...")
-                events_start = asyncio.get_event_loop().time()
+                db_duration = (perf_counter_ns() - db_start) / 1e9
                 
-                # Собираем статистику
-                online_count = sum(1 for r in valid_results if r["status"] == "online")
-                offline_count = sum(1 for r in valid_results if r["status"] == "offline")
-                error_count = sum(1 for r in valid_results if r["status"] == "error")
+                # ============ PHASE 3: Emit events ============
+                logger.debug("Phase 3: Отправка SSE событий...")
+                events_start = perf_counter_ns()
                 
-                # Отправляем событие о завершении пинга (batch)
+                # Собираем статистику за один проход
+                counts = Counter(r.status for r in valid_results)
+                online_count, offline_count, error_count = counts["online"], counts["offline"], counts["error"]
+                
+                # Смены статусов и завершение пинга - по одному событию на цикл
+                await device_event_manager.status_changes(changes)
                 await device_event_manager.ping_completed(valid_results)
                 
-                events_duration = asyncio.get_event_loop().time() - events_start
+                events_duration = (perf_counter_ns() - events_start) / 1e9
                 
                 # Общая статистика цикла
                 total_duration = ping_duration + db_duration + events_duration
                 
                 logger.info(
-                    f"Цикл завершён: {len(valid_results)} устройств, "
-                    f"{online_count} online, {offline_count} offline, {error_count} error | "
-                    f"Timing: ping={ping_duration:.2f}s, db={db_duration:.2f}s, "
-                    f"events={events_duration:.2f}s, total={total_duration:.2f}s"
+                    "Цикл завершён: %d устройств, %d online, %d offline, %d error | "
+                    "Timing: ping=%.2fs, db=%.2fs, events=%.2fs, total=%.2fs",
+                    len(valid_results), online_count, offline_count, error_count,
+                    ping_duration, db_duration, events_duration, total_duration
                 )
                 
-                # Ждем до следующего цикла
-                await asyncio.sleep(self.ping_interval)
-                
             except asyncio.CancelledError:
-                logger.info("Цикл мониторинга отменен")
                 break
             except Exception as e:
-                logger.error(f"Ошибка в цикле мониторинга: {e}", exc_info=True)
-                await asyncio.sleep(5)  # Короткая пауза при ошибке
+                logger.error(f"Ошибка обработки цикла мониторинга: {e}", exc_info=True)
+    
+    async def _ping_all_async(
+        self, now: Optional[datetime] = None, monitors: Optional[List[DeviceMonitor]] = None
+    ) -> Tuple[list, list]:
+        """Пинг мониторов (по умолчанию всех) одним вызовом async_multiping
+
+        Результаты раскладываются по DeviceMonitor.update_from_result. Если
+        пакетный вызов падает (например, не резолвится одно из имен),
+        пингуем устройства по отдельности. Возвращает список результатов в
+        формате asyncio.gather(..., return_exceptions=True) и список смен
+        статусов для DeviceEventManager.status_changes.
+        """
+        if monitors is None:
+            monitors = list(self.monitors.values())
+        changes = []
+        try:
+            hosts = await async_multiping(
+                [monitor.ip for monitor in monitors], count=1, timeout=3,
+                concurrent_tasks=min(len(monitors), MAX_CONCURRENT_PINGS)
+            )
+        except Exception as e:
+            logger.warning(f"Пакетный пинг не удался ({e}), пингуем устройства по отдельности")
+            # Каждый async_ping - свой сокет: ограничиваем число одновременных
+            semaphore = asyncio.Semaphore(MAX_CONCURRENT_PINGS)
+            
+            async def _bounded_ping(monitor: DeviceMonitor) -> PingResult:
+                async with semaphore:
+                    return await monitor.ping(changes, now)
+            
+            results = await asyncio.gather(
+                *[_bounded_ping(monitor) for monitor in monitors], return_exceptions=True
+            )
+        else:
+            results = []
+            for monitor, host in zip(monitors, hosts):
+                try:
+                    results.append(monitor.update_from_result(host, changes, now))
+                except Exception as e:
+                    results.append(e)
         
-        logger.info("Цикл мониторинга завершен")
+        # Состояния мониторов изменились - снимок для get_status устарел
+        self._monitors_snapshot = None
+        return results, changes
     
     async def _reload_configuration(self):
         """Перезагрузить конфигурацию устройств"""
@@ -416,32 +686,71 @@ class MonitoringService:
                 logger.info(f"Интервал пинга изменен на {self.ping_interval} секунд")
             
             # Загружаем устройства
-            devices = self._load_devices_from_config()
+            devices = await asyncio.to_thread(self._load_devices_from_config)
+            if devices is self._monitored_devices:
+                return  # Список не изменился - мониторы не пересобираем
             
-            # Обновляем мониторы
-            new_monitors = {}
-            for device_id, ip, description in devices:
-                if device_id in self.monitors:
-                    # Обновляем существующий монитор
-                    monitor = self.monitors[device_id]
-                    monitor.ip = ip
-                    monitor.description = description
-                    new_monitors[device_id] = monitor
-                else:
-                    # Создаем новый монитор
-                    new_monitors[device_id] = DeviceMonitor(device_id, ip, description)
-                    logger.info(f"Добавлен новый монитор для {device_id} ({ip})")
+            # Устройства из IP_list.json (fallback), которых нет в БД
+            await asyncio.to_thread(self._create_missing_devices, devices)
+            
+            # Обновляем мониторы на месте: существующие объекты (с их
+            # историей пингов) остаются, меняется только разница
+            incoming = {device_id: (ip, description) for device_id, ip, description in devices}
+            monitors = self.monitors
             
             # Удаляем старые мониторы
-            removed = set(self.monitors.keys()) - set(new_monitors.keys())
-            for device_id in removed:
+            for device_id in monitors.keys() - incoming.keys():
+                del monitors[device_id]
                 logger.info(f"Удален монитор для {device_id}")
             
-            self.monitors = new_monitors
+            for device_id, (ip, description) in incoming.items():
+                monitor = monitors.get(device_id)
+                if monitor is None:
+                    # Создаем новый монитор
+                    monitors[device_id] = DeviceMonitor(device_id, ip, description)
+                    logger.info(f"Добавлен новый монитор для {device_id} ({ip})")
+                elif monitor.ip != ip or monitor.description != description:
+                    # Обновляем существующий монитор
+                    monitor.ip = ip
+                    monitor.description = description
+            
+            self._monitored_devices = devices
+            self._monitors_snapshot = None
             
         except Exception as e:
             logger.error(f"Ошибка перезагрузки конфигурации: {e}")
     
+    def request_reload(self):
+        """Запросить перезагрузку конфигурации
+
+        Запросы в пределах окна debounce объединяются в одну перезагрузку,
+        поэтому пакетное изменение N устройств не вызывает N перезагрузок.
+        Запрос, пришедший во время уже идущей перезагрузки, не теряется -
+        после нее выполняется еще одна.
+        """
+        self._reload_pending = True
+        if self._reload_task is None or self._reload_task.done():
+            self._reload_task = asyncio.create_task(self._debounced_reload())
+    
+    def reload_after_commit(self, session: Session):
+        """Запросить перезагрузку после commit сессии
+
+        Сам запрос выполняет обработчик after_commit, поэтому эндпоинт не
+        держит сессию ради планирования перезагрузки, а при откате
+        транзакции перезагрузка не запрашивается.
+        """
+        session.info[RELOAD_AFTER_COMMIT_KEY] = True
+    
+    async def _debounced_reload(self):
+        """Перезагрузить конфигурацию после окна debounce
+
+        Повторяет перезагрузку, пока во время предыдущей приходили новые запросы.
+        """
+        while self._reload_pending:
+            await asyncio.sleep(self.reload_debounce)
+            self._reload_pending = False
+            await self._reload_configuration()
+    
     async def start(self):
         """Запустить мониторинг"""
         if self.is_running:
@@ -453,8 +762,10 @@ class MonitoringService:
         # Загружаем конфигурацию
         await self._reload_configuration()
         
-        # Запускаем цикл мониторинга
+        # Запускаем цикл мониторинга и обработчик его результатов
         self.is_running = True
+        self._cycle_queue = asyncio.Queue(maxsize=CYCLE_QUEUE_SIZE)
+        self.consumer_task = asyncio.create_task(self._consumer_loop())
         self.monitoring_task = asyncio.create_task(self._monitoring_loop())
         
         # Отправляем событие о запуске
@@ -478,13 +789,16 @@ class MonitoringService:
         logger.info("Остановка сервиса мониторинга")
         
         self.is_running = False
+        # Отложенная перезагрузка не должна пересобрать мониторы после остановки
+        self._reload_pending = False
         
-        if self.monitoring_task:
-            self.monitoring_task.cancel()
-            try:
-                await self.monitoring_task
-            except asyncio.CancelledError:
-                pass
+        for task in (self.monitoring_task, self.consumer_task, self._reload_task):
+            if task:
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
         
         # Отправляем событие об остановке
         await event_manager.publish({
@@ -496,7 +810,7 @@ class MonitoringService:
         
         logger.info("Мониторинг остановлен")
     
-    async def ping_all_now(self) -> List[Dict[str, any]]:
+    async def ping_all_now(self) -> List[PingResult]:
         """Выполнить немедленный пинг всех устройств"""
         if not self.monitors:
             await self._reload_configuration()
@@ -506,33 +820,32 @@ class MonitoringService:
         
         logger.info(f"Выполнение немедленного пинга {len(self.monitors)} устройств")
         
-        # Запускаем все пинги параллельно
-        ping_tasks = [monitor.ping() for monitor in self.monitors.values()]
-        results = await asyncio.gather(*ping_tasks, return_exceptions=True)
+        results, changes = await self._ping_all_async(datetime.utcnow())
         
         # Фильтруем успешные результаты
         valid_results = []
         for result in results:
-            if isinstance(result, dict):
+            if isinstance(result, PingResult):
                 valid_results.append(result)
             else:
-                logger.error(f"Ошибка пинга: {result}")
+                logger.error("Ошибка пинга: %s", result)
         
         # Обновляем БД
         if valid_results:
             await self._update_database_status(valid_results)
+            await device_event_manager.status_changes(changes)
             await device_event_manager.ping_completed(valid_results)
         
         return valid_results
     
     def get_status(self) -> Dict[str, any]:
-        """Получить статус сервиса мониторинга"""
-        return {
-            "is_running": self.is_running,
-            "devices_count": len(self.monitors),
-            "ping_interval": self.ping_interval,
-            "last_config_check": self.last_config_check.isoformat() if self.last_config_check else None,
-            "monitors": {
+        """Получить статус сервиса мониторинга
+
+        Словарь "monitors" строится один раз между пингами и общий для всех
+        вызовов - изменять его нельзя.
+        """
+        if self._monitors_snapshot is None:
+            self._monitors_snapshot = {
                 device_id: {
                     "ip": monitor.ip,
                     "current_status": monitor.current_status,
@@ -543,8 +856,27 @@ class MonitoringService:
                 }
                 for device_id, monitor in self.monitors.items()
             }
+        return {
+            "is_running": self.is_running,
+            "devices_count": len(self.monitors),
+            "ping_interval": self.ping_interval,
+            "last_config_check": self.last_config_check.isoformat() if self.last_config_check else None,
+            "monitors": self._monitors_snapshot
         }
 
 
 # Глобальный экземпляр сервиса мониторинга
-monitoring_service = MonitoringService()
\ No newline at end of file
+monitoring_service = MonitoringService()
+
+
+@event.listens_for(Session, "after_commit")
+def _request_reload_after_commit(session: Session):
+    """Запросить перезагрузку конфигурации, если сессия была помечена"""
+    if session.info.pop(RELOAD_AFTER_COMMIT_KEY, False) and monitoring_service.is_running:
+        monitoring_service.request_reload()
+
+
+@event.listens_for(Session, "after_rollback")
+def _drop_reload_after_rollback(session: Session):
+    """Откат транзакции отменяет запрос перезагрузки"""
+    session.info.pop(RELOAD_AFTER_COMMIT_KEY, None)
\ No newline at end of file
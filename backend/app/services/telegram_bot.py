@@ -4,12 +4,11 @@
 """
 
 import asyncio
-import json
 import logging
 import signal
 import sys
 from datetime import datetime
-from typing import Dict, List, Optional, Any
+from typing import Dict, FrozenSet, List, Optional, Any
 from pathlib import Path
 
 from aiogram import Bot, Dispatcher, types, F
@@ -24,8 +23,9 @@ from aiogram.types import (
     Message
 )
 from aiogram.utils.keyboard import InlineKeyboardBuilder
-from aiogram.exceptions import TelegramBadRequest
+from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
 
+from ..utils.config_files import parse_chat_ids, read_json_cached
 from ..utils.events_bus import event_manager
 from .monitoring import monitoring_service
 
@@ -40,6 +40,92 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Рассылка: сколько сообщений отправлять одновременно и пауза между пачками (сек)
+SEND_BATCH_SIZE = 25
+SEND_BATCH_INTERVAL = 1.0
+
+
+def _menu_keyboard(text: str, callback_data: str) -> InlineKeyboardMarkup:
+    """Клавиатура из одной кнопки действия и кнопки возврата в главное меню"""
+    builder = InlineKeyboardBuilder()
+    builder.row(InlineKeyboardButton(text=text, callback_data=callback_data))
+    builder.row(InlineKeyboardButton(text="🏠 Главное меню", callback_data="main_menu"))
+    return builder.as_markup()
+
+
+def _build_main_keyboard() -> InlineKeyboardMarkup:
+    """Главная клавиатура"""
+    builder = InlineKeyboardBuilder()
+    
+    builder.row(
+        InlineKeyboardButton(text="📊 Статус системы", callback_data="system_status"),
+        InlineKeyboardButton(text="📈 Статистика", callback_data="statistics")
+    )
+    builder.row(
+        InlineKeyboardButton(text="📋 Все устройства", callback_data="all_devices"),
+        InlineKeyboardButton(text="🎯 Пинг сейчас", callback_data="ping_now")
+    )
+    builder.row(
+        InlineKeyboardButton(text="🟢 Онлайн", callback_data="online_devices"),
+        InlineKeyboardButton(text="🔴 Офлайн", callback_data="offline_devices")
+    )
+    builder.row(
+        InlineKeyboardButton(text="🏗️ Категории", callback_data="categories"),
+        InlineKeyboardButton(text="🔔 Уведомления", callback_data="notifications")
+    )
+    builder.row(
+        InlineKeyboardButton(text="ℹ️ Помощь", callback_data="help")
+    )
+    
+    return builder.as_markup()
+
+
+# Статичные клавиатуры собираются один раз при импорте
+MAIN_KEYBOARD = _build_main_keyboard()
+SYSTEM_STATUS_KEYBOARD = _menu_keyboard("🔄 Обновить", "system_status")
+ALL_DEVICES_KEYBOARD = _menu_keyboard("🔄 Обновить", "all_devices")
+PING_RESULT_KEYBOARD = _menu_keyboard("📋 Подробности", "all_devices")
+NOTIFICATIONS_ON_KEYBOARD = _menu_keyboard("🔕 Отключить уведомления", "notifications")
+NOTIFICATIONS_OFF_KEYBOARD = _menu_keyboard("🔔 Включить уведомления", "notifications")
+
+BOT_COMMANDS = [
+    types.BotCommand(command="start", description="Главное меню"),
+    types.BotCommand(command="help", description="Справка"),
+    types.BotCommand(command="status", description="Статус системы"),
+    types.BotCommand(command="ping", description="Пинг всех устройств")
+]
+
+# Текст /help, подставляется только ID пользователя
+HELP_TEMPLATE = """
+<b>ℹ️ Справка TurboShpalych Pro</b>
+
+<b>📱 Основные команды:</b>
+• /start - Главное меню
+• /help - Эта справка
+• /status - Быстрый статус
+• /ping - Пинг всех устройств
+
+<b>🎯 Возможности:</b>
+• Мониторинг турникетов в реальном времени
+• Автоматические уведомления о сбоях
+• Детальная статистика и графики
+• Управление категориями устройств
+• Система мероприятий
+
+<b>🔔 Уведомления:</b>
+• Падение устройства
+• Восстановление устройства
+• Изменение статуса мониторинга
+• Критические ошибки системы
+
+<b>💡 Подсказки:</b>
+• Используйте кнопки для навигации
+• Подпишитесь на уведомления
+• Проверяйте статистику регулярно
+
+<b>🆔 Ваш ID:</b> <code>{uid}</code>
+"""
+
 
 class UserStates(StatesGroup):
     """Состояния пользователя"""
@@ -56,6 +142,7 @@ class TelegramBotService:
         self.bot: Optional[Bot] = None
         self.dp: Optional[Dispatcher] = None
         self.is_running = False
+        self._authorized_chat_ids: FrozenSet[int] = frozenset()
         self.config = self._load_config()
         self.authorized_users = set()
         self.notification_subscribers = set()
@@ -66,88 +153,63 @@ class TelegramBotService:
         self.commands_processed = 0
         
     def _load_config(self) -> Dict[str, Any]:
-        """Загрузить конфигурацию бота"""
+        """Загрузить конфигурацию бота
+        
+        Заодно пересчитывает множество авторизованных чатов, чтобы проверка
+        доступа на каждое сообщение не разбирала chat_id заново.
+        """
         try:
             BASE_DIR = Path(__file__).parent.parent.parent.parent
             config_path = BASE_DIR / "config.json"
             
-            if config_path.exists():
-                with open(config_path, 'r', encoding='utf-8') as f:
-                    return json.load(f)
-            
-            return {}
+            config = read_json_cached(config_path)
         except Exception as e:
             logger.error(f"Ошибка загрузки конфигурации: {e}")
-            return {}
+            config = {}
+        
+        self._authorized_chat_ids = frozenset(parse_chat_ids(config.get("chat_id", [])))
+        return config
     
-    def _get_authorized_chat_ids(self) -> List[int]:
-        """Получить список авторизованных чатов"""
-        chat_ids = self.config.get("chat_id", [])
-        
-        if isinstance(chat_ids, (str, int)):
-            try:
-                return [int(chat_ids)]
-            except ValueError:
-                return []
-        elif isinstance(chat_ids, list):
-            result = []
-            for chat_id in chat_ids:
-                try:
-                    result.append(int(chat_id))
-                except (ValueError, TypeError):
-                    continue
-            return result
-        
-        return []
+    def _get_authorized_chat_ids(self) -> FrozenSet[int]:
+        """Получить множество авторизованных чатов"""
+        return self._authorized_chat_ids
     
     def _is_authorized(self, user_id: int) -> bool:
         """Проверить авторизацию пользователя"""
-        authorized_ids = self._get_authorized_chat_ids()
-        return user_id in authorized_ids or user_id in self.authorized_users
+        return user_id in self._authorized_chat_ids or user_id in self.authorized_users
+    
+    async def _send_message(self, user_id: int, message: str, parse_mode: str):
+        """Отправить одно сообщение, при 429 подождать retry_after и повторить один раз"""
+        try:
+            await self.bot.send_message(chat_id=user_id, text=message, parse_mode=parse_mode)
+        except TelegramRetryAfter as e:
+            await asyncio.sleep(e.retry_after)
+            await self.bot.send_message(chat_id=user_id, text=message, parse_mode=parse_mode)
     
     async def _send_to_subscribers(self, message: str, parse_mode: str = "HTML"):
-        """Отправить сообщение всем подписчикам"""
+        """Отправить сообщение всем подписчикам
+        
+        Сообщения уходят параллельно пачками по SEND_BATCH_SIZE, между пачками
+        выдерживается пауза, чтобы не упираться в лимиты Telegram.
+        """
         if not self.bot:
             return
             
-        subscribers = self.notification_subscribers.union(set(self._get_authorized_chat_ids()))
-        
-        for user_id in subscribers:
-            try:
-                await self.bot.send_message(
-                    chat_id=user_id,
-                    text=message,
-                    parse_mode=parse_mode
-                )
-                self.messages_sent += 1
-            except Exception as e:
-                logger.error(f"Ошибка отправки сообщения пользователю {user_id}: {e}")
-    
-    def _create_main_keyboard(self) -> InlineKeyboardMarkup:
-        """Создать главную клавиатуру"""
-        builder = InlineKeyboardBuilder()
-        
-        builder.row(
-            InlineKeyboardButton(text="📊 Статус системы", callback_data="system_status"),
-            InlineKeyboardButton(text="📈 Статистика", callback_data="statistics")
-        )
-        builder.row(
-            InlineKeyboardButton(text="📋 Все устройства", callback_data="all_devices"),
-            InlineKeyboardButton(text="🎯 Пинг сейчас", callback_data="ping_now")
-        )
-        builder.row(
-            InlineKeyboardButton(text="🟢 Онлайн", callback_data="online_devices"),
-            InlineKeyboardButton(text="🔴 Офлайн", callback_data="offline_devices")
-        )
-        builder.row(
-            InlineKeyboardButton(text="🏗️ Категории", callback_data="categories"),
-            InlineKeyboardButton(text="🔔 Уведомления", callback_data="notifications")
-        )
-        builder.row(
-            InlineKeyboardButton(text="ℹ️ Помощь", callback_data="help")
-        )
-        
-        return builder.as_markup()
+        subscribers = list(self.notification_subscribers | self._authorized_chat_ids)
+        
+        for i in range(0, len(subscribers), SEND_BATCH_SIZE):
+            if i:
+                await asyncio.sleep(SEND_BATCH_INTERVAL)
+            batch = subscribers[i:i + SEND_BATCH_SIZE]
+            results = await asyncio.gather(
+                *(self._send_message(user_id, message, parse_mode) for user_id in batch),
+                return_exceptions=True
+            )
+            for user_id, result in zip(batch, results):
+                if isinstance(result, Exception):
+                    logger.error(f"Ошибка отправки сообщения пользователю {user_id}: {result}")
+                else:
+                    self.messages_sent += 1
     
     def _format_device_list(self, devices: List[Dict[str, Any]], title: str) -> str:
         """Форматировать список устройств"""
@@ -249,7 +311,7 @@ class TelegramBotService:
         await message.answer(
             welcome_text,
             parse_mode="HTML",
-            reply_markup=self._create_main_keyboard()
+            reply_markup=MAIN_KEYBOARD
         )
         self.messages_sent += 1
     
@@ -257,37 +319,7 @@ class TelegramBotService:
         """Обработчик команды /help"""
         self.commands_processed += 1
         
-        help_text = """
-<b>ℹ️ Справка TurboShpalych Pro</b>
-
-<b>📱 Основные команды:</b>
-• /start - Главное меню
-• /help - Эта справка
-• /status - Быстрый статус
-• /ping - Пинг всех устройств
-
-<b>🎯 Возможности:</b>
-• Мониторинг турникетов в реальном времени
-• Автоматические уведомления о сбоях
-• Детальная статистика и графики
-• Управление категориями устройств
-• Система мероприятий
-
-<b>🔔 Уведомления:</b>
-• Падение устройства
-• Восстановление устройства
-• Изменение статуса мониторинга
-• Критические ошибки системы
-
-<b>💡 Подсказки:</b>
-• Используйте кнопки для навигации
-• Подпишитесь на уведомления
-• Проверяйте статистику регулярно
-
-<b>🆔 Ваш ID:</b> <code>{message.from_user.id}</code>
-"""
-        
-        await message.answer(help_text, parse_mode="HTML")
+        await message.answer(HELP_TEMPLATE.format(uid=message.from_user.id), parse_mode="HTML")
         self.messages_sent += 1
     
     async def cmd_status(self, message: Message):
@@ -317,7 +349,7 @@ class TelegramBotService:
         try:
             results = await monitoring_service.ping_all_now()
             
-            online_count = sum(1 for r in results if r["status"] == "online")
+            online_count = sum(1 for r in results if r.status == "online")
             offline_count = len(results) - online_count
             
             result_text = f"""
@@ -347,14 +379,10 @@ class TelegramBotService:
         monitoring_status = monitoring_service.get_status()
         stats_text = self._format_statistics(monitoring_status)
         
-        keyboard = InlineKeyboardBuilder()
-        keyboard.row(InlineKeyboardButton(text="🔄 Обновить", callback_data="system_status"))
-        keyboard.row(InlineKeyboardButton(text="🏠 Главное меню", callback_data="main_menu"))
-        
         await callback.message.edit_text(
             stats_text,
             parse_mode="HTML",
-            reply_markup=keyboard.as_markup()
+            reply_markup=SYSTEM_STATUS_KEYBOARD
         )
     
     async def handle_all_devices(self, callback: CallbackQuery):
@@ -376,14 +404,10 @@ class TelegramBotService:
         devices.sort(key=lambda x: x["device_id"])
         text = self._format_device_list(devices, "Все устройства")
         
-        keyboard = InlineKeyboardBuilder()
-        keyboard.row(InlineKeyboardButton(text="🔄 Обновить", callback_data="all_devices"))
-        keyboard.row(InlineKeyboardButton(text="🏠 Главное меню", callback_data="main_menu"))
-        
         await callback.message.edit_text(
             text,
             parse_mode="HTML",
-            reply_markup=keyboard.as_markup()
+            reply_markup=ALL_DEVICES_KEYBOARD
         )
     
     async def handle_ping_now(self, callback: CallbackQuery):
@@ -395,8 +419,8 @@ class TelegramBotService:
         try:
             results = await monitoring_service.ping_all_now()
             
-            online_devices = [r for r in results if r["status"] == "online"]
-            offline_devices = [r for r in results if r["status"] == "offline"]
+            online_devices = [r for r in results if r.status == "online"]
+            offline_devices = [r for r in results if r.status == "offline"]
             
             text = f"""
 <b>🎯 Результаты пинга</b>
@@ -410,14 +434,10 @@ class TelegramBotService:
 <b>⏰ Выполнено:</b> {datetime.now().strftime('%H:%M:%S')}
 """
             
-            keyboard = InlineKeyboardBuilder()
-            keyboard.row(InlineKeyboardButton(text="📋 Подробности", callback_data="all_devices"))
-            keyboard.row(InlineKeyboardButton(text="🏠 Главное меню", callback_data="main_menu"))
-            
             await callback.message.edit_text(
                 text,
                 parse_mode="HTML",
-                reply_markup=keyboard.as_markup()
+                reply_markup=PING_RESULT_KEYBOARD
             )
             
         except Exception as e:
@@ -434,23 +454,17 @@ class TelegramBotService:
         if is_subscribed:
             self.notification_subscribers.discard(user_id)
             text = "🔕 <b>Уведомления отключены</b>\n\nВы больше не будете получать автоматические уведомления о статусе устройств."
-            button_text = "🔔 Включить уведомления"
-            callback_data = "notifications"
+            keyboard = NOTIFICATIONS_OFF_KEYBOARD
         else:
             self.notification_subscribers.add(user_id)
             text = "🔔 <b>Уведомления включены</b>\n\nВы будете получать уведомления о:\n• Падении устройств\n• Восстановлении устройств\n• Критических ошибках системы"
-            button_text = "🔕 Отключить уведомления"
-            callback_data = "notifications"
-        
-        keyboard = InlineKeyboardBuilder()
-        keyboard.row(InlineKeyboardButton(text=button_text, callback_data=callback_data))
-        keyboard.row(InlineKeyboardButton(text="🏠 Главное меню", callback_data="main_menu"))
+            keyboard = NOTIFICATIONS_ON_KEYBOARD
         
         await callback.answer("✅ Настройки обновлены")
         await callback.message.edit_text(
             text,
             parse_mode="HTML",
-            reply_markup=keyboard.as_markup()
+            reply_markup=keyboard
         )
     
     async def handle_main_menu(self, callback: CallbackQuery, state: FSMContext):
@@ -474,7 +488,7 @@ class TelegramBotService:
         await callback.message.edit_text(
             text,
             parse_mode="HTML",
-            reply_markup=self._create_main_keyboard()
+            reply_markup=MAIN_KEYBOARD
         )
     
     def _register_handlers(self):
@@ -498,7 +512,12 @@ class TelegramBotService:
             event_type = event.get("type")
             data = event.get("data", {})
             
-            if event_type == "device_failure":
+            if event_type == "device_status_changes":
+                # Смены статусов за цикл пинга приходят одним событием
+                for change in data:
+                    await self._handle_monitoring_events({"type": change.get("type"), "data": change})
+                
+            elif event_type == "device_failure":
                 device_id = data.get("device_id")
                 ip = data.get("ip")
                 message = f"""
@@ -582,12 +601,7 @@ class TelegramBotService:
         
         try:
             # Устанавливаем команды бота
-            await self.bot.set_my_commands([
-                types.BotCommand(command="start", description="Главное меню"),
-                types.BotCommand(command="help", description="Справка"),
-                types.BotCommand(command="status", description="Статус системы"),
-                types.BotCommand(command="ping", description="Пинг всех устройств")
-            ])
+            await self.bot.set_my_commands(BOT_COMMANDS)
             
             # Отправляем уведомление о запуске
             await self._send_to_subscribers(f"""
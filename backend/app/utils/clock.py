@@ -0,0 +1,37 @@
+"""
+Утилиты для отметок времени в ответах API
+"""
+
+import time
+from datetime import datetime, timezone
+
+# [секунда, отформатированная строка]
+_ts_cache = [0, ""]
+_local_ts_cache = [0, ""]
+
+
+def iso_now() -> str:
+    """Текущее время UTC в ISO-формате с точностью до секунды
+
+    Строка форматируется один раз в секунду, остальные вызовы в пределах
+    той же секунды возвращают ее из кэша. Подходит для служебных
+    timestamp (health, статистика, heartbeat), где доли секунды не нужны.
+    Формат без суффикса зоны - как у остальных timestamp API.
+    """
+    t = int(time.time())
+    if t != _ts_cache[0]:
+        _ts_cache[1] = datetime.fromtimestamp(t, timezone.utc).replace(tzinfo=None).isoformat()
+        _ts_cache[0] = t
+    return _ts_cache[1]
+
+
+def iso_now_local() -> str:
+    """То же, что iso_now, но в локальном времени сервера (как datetime.now())
+
+    Используется там, где API исторически отдавал локальное время (health).
+    """
+    t = int(time.time())
+    if t != _local_ts_cache[0]:
+        _local_ts_cache[1] = datetime.fromtimestamp(t).isoformat()
+        _local_ts_cache[0] = t
+    return _local_ts_cache[1]
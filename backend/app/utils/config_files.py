@@ -0,0 +1,90 @@
+"""
+Утилиты для работы с JSON-файлами конфигурации
+(config.json, IP_list.json)
+"""
+
+import asyncio
+import os
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+import orjson
+
+# path -> (st_mtime_ns, разобранные данные)
+_json_cache: Dict[Path, Tuple[int, Any]] = {}
+
+
+def read_json_cached(path: Path) -> Any:
+    """Прочитать JSON-файл с кэшем по mtime
+
+    Файл перечитывается только когда меняется его st_mtime_ns. Возвращается
+    общий для всех вызовов объект - изменять его нельзя. Для отсутствующего
+    файла возвращается пустой dict.
+    """
+    try:
+        mtime_ns = path.stat().st_mtime_ns
+    except FileNotFoundError:
+        _json_cache.pop(path, None)
+        return {}
+
+    cached = _json_cache.get(path)
+    if cached is not None and cached[0] == mtime_ns:
+        return cached[1]
+
+    data = orjson.loads(path.read_bytes())
+    _json_cache[path] = (mtime_ns, data)
+    return data
+
+
+async def read_json_cached_async(path: Path) -> Any:
+    """Асинхронный вариант read_json_cached
+
+    При актуальном кэше возвращает данные сразу, в event loop (один stat).
+    Чтение и разбор файла при промахе кэша выполняются в потоке, чтобы не
+    останавливать обработку остальных запросов.
+    """
+    try:
+        mtime_ns = path.stat().st_mtime_ns
+    except FileNotFoundError:
+        _json_cache.pop(path, None)
+        return {}
+
+    cached = _json_cache.get(path)
+    if cached is not None and cached[0] == mtime_ns:
+        return cached[1]
+
+    return await asyncio.to_thread(read_json_cached, path)
+
+
+def write_json_atomic(path: Path, data: Dict[str, Any]):
+    """Атомарно записать JSON в файл
+
+    Данные пишутся во временный файл одним вызовом, затем подменяют
+    исходный через os.replace - читатель никогда не увидит
+    частично записанный файл.
+    """
+    tmp_path = path.with_suffix(".json.tmp")
+    tmp_path.write_bytes(orjson.dumps(data, option=orjson.OPT_INDENT_2))
+    os.replace(tmp_path, path)
+
+
+def parse_chat_ids(chat_ids: Any) -> List[int]:
+    """Приводит chat_id из config.json к списку int
+
+    ID групп Telegram отрицательные, поэтому str.isdigit() не подходит.
+    PUT /config сохраняет список int, так что обычно хватает одного прохода.
+    """
+    if isinstance(chat_ids, (str, int)):
+        chat_ids = [chat_ids]
+    if not isinstance(chat_ids, list):
+        return []
+    try:
+        return [int(x) for x in chat_ids]
+    except (ValueError, TypeError):
+        result = []
+        for x in chat_ids:
+            try:
+                result.append(int(x))
+            except (ValueError, TypeError):
+                continue
+        return result
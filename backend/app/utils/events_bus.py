@@ -4,33 +4,91 @@ Server-Sent Events для передачи данных на фронтенд
 """
 
 import asyncio
-import json
-from typing import Dict, Any, List, Callable
+from typing import Dict, Any, List, Callable, Optional, Set
 from datetime import datetime
 import logging
 
+import orjson
+from starlette.responses import StreamingResponse
+from starlette.types import Send
+
+from .clock import iso_now
+
 logger = logging.getLogger(__name__)
 
 
+def encode_sse_frame(event: Dict[str, Any]) -> bytes:
+    """Закодировать событие в SSE-кадр (orjson сразу отдает UTF-8 байты)"""
+    return b"data: " + orjson.dumps(event, option=orjson.OPT_NON_STR_KEYS) + b"\n\n"
+
+
 class EventManager:
     """Менеджер событий для Server-Sent Events"""
     
     def __init__(self):
         self._subscribers: List[Callable] = []
+        # SSE клиенты получают готовый кадр, закодированный один раз на событие
+        self._sse_clients: Set["SSEResponse"] = set()
         self._event_history: List[Dict[str, Any]] = []
         self._max_history = 100
+        # Издатели только кладут событие в очередь, рассылкой занимается
+        # одна фоновая задача _broadcast_loop
+        self._source: asyncio.Queue = asyncio.Queue()
+        self._broadcast_task: Optional[asyncio.Task] = None
+        # Callback-подписчики (бот) обрабатываются своей задачей, чтобы их
+        # сетевые запросы и паузы не задерживали кадры SSE клиентам
+        self._callback_source: asyncio.Queue = asyncio.Queue()
+        self._callback_task: Optional[asyncio.Task] = None
+        # Установлено, пока есть хотя бы один подписчик любого вида
+        self._subscribers_present = asyncio.Event()
         
     async def subscribe(self, callback: Callable):
         """Подписаться на события"""
         self._subscribers.append(callback)
+        self._update_presence()
         logger.info(f"Новый подписчик добавлен. Всего подписчиков: {len(self._subscribers)}")
         
     async def unsubscribe(self, callback: Callable):
         """Отписаться от событий"""
         if callback in self._subscribers:
             self._subscribers.remove(callback)
+            self._update_presence()
             logger.info(f"Подписчик удален. Осталось подписчиков: {len(self._subscribers)}")
             
+    def subscribe_sse(self, client: "SSEResponse"):
+        """Подписать SSE клиента"""
+        self._sse_clients.add(client)
+        self._update_presence()
+        logger.info(f"Новый SSE клиент подключен. Всего SSE клиентов: {len(self._sse_clients)}")
+    
+    def unsubscribe_sse(self, client: "SSEResponse"):
+        """Отписать SSE клиента"""
+        if client in self._sse_clients:
+            self._sse_clients.discard(client)
+            self._update_presence()
+            logger.info(f"SSE клиент отключен. Осталось SSE клиентов: {len(self._sse_clients)}")
+            
+    def _update_presence(self):
+        """Обновить флаг наличия подписчиков"""
+        if self._subscribers or self._sse_clients:
+            self._subscribers_present.set()
+        else:
+            self._subscribers_present.clear()
+    
+    async def wait_for_subscribers(self, timeout: float) -> bool:
+        """Дождаться появления подписчика, но не дольше timeout секунд
+
+        Возвращает True, если подписчики есть. Ожидание прерывается сразу,
+        как только подключается первый подписчик.
+        """
+        if self._subscribers_present.is_set():
+            return True
+        try:
+            await asyncio.wait_for(self._subscribers_present.wait(), timeout)
+        except asyncio.TimeoutError:
+            return False
+        return True
+    
     async def publish(self, event: Dict[str, Any]):
         """Опубликовать событие всем подписчикам"""
         try:
@@ -43,33 +101,79 @@ class EventManager:
             if len(self._event_history) > self._max_history:
                 self._event_history = self._event_history[-self._max_history:]
             
-            # Отправляем всем подписчикам
-            if self._subscribers:
-                logger.debug(f"Отправка события {event.get('type', 'unknown')} для {len(self._subscribers)} подписчиков")
-                
-                # Создаем копии для каждого подписчика
-                failed_subscribers = []
-                for subscriber in self._subscribers[:]:  # Создаем копию списка
-                    try:
-                        await subscriber(event)
-                    except Exception as e:
-                        logger.error(f"Ошибка отправки события подписчику: {e}")
-                        failed_subscribers.append(subscriber)
-                
-                # Удаляем неработающих подписчиков
-                for failed in failed_subscribers:
-                    await self.unsubscribe(failed)
+            if self._subscribers or self._sse_clients:
+                self._source.put_nowait(event)
+                self._ensure_broadcaster()
                     
         except Exception as e:
             logger.error(f"Ошибка публикации события: {e}")
     
+    def _ensure_broadcaster(self):
+        """Запустить задачу рассылки, если она еще не работает"""
+        if self._broadcast_task is None or self._broadcast_task.done():
+            self._broadcast_task = asyncio.create_task(self._broadcast_loop())
+    
+    async def _broadcast_loop(self):
+        """Разослать события из очереди всем подписчикам
+
+        Одно пробуждение на событие: кадр кодируется один раз и кладется
+        в очереди SSE клиентов через put_nowait, отстающие клиенты
+        отключаются в SSEResponse._enqueue.
+        """
+        while True:
+            event = await self._source.get()
+            try:
+                await self._dispatch(event)
+            except Exception as e:
+                logger.error(f"Ошибка рассылки события: {e}")
+    
+    async def _dispatch(self, event: Dict[str, Any]):
+        """Отправить одно событие SSE клиентам и передать callback-подписчикам"""
+        # SSE клиентам - один кадр на всех
+        if self._sse_clients:
+            frame = encode_sse_frame(event)
+            for client in list(self._sse_clients):
+                client.send_frame(frame)
+                if not client.connected:
+                    self.unsubscribe_sse(client)
+        
+        if self._subscribers:
+            self._callback_source.put_nowait(event)
+            if self._callback_task is None or self._callback_task.done():
+                self._callback_task = asyncio.create_task(self._callback_loop())
+    
+    async def _callback_loop(self):
+        """Вызвать callback-подписчиков для событий из очереди, по порядку"""
+        while True:
+            event = await self._callback_source.get()
+            try:
+                await self._notify_subscribers(event)
+            except Exception as e:
+                logger.error(f"Ошибка рассылки события подписчикам: {e}")
+    
+    async def _notify_subscribers(self, event: Dict[str, Any]):
+        """Отправить одно событие callback-подписчикам"""
+        logger.debug(f"Отправка события {event.get('type', 'unknown')} для {len(self._subscribers)} подписчиков")
+        
+        failed_subscribers = []
+        for subscriber in self._subscribers[:]:  # Создаем копию списка
+            try:
+                await subscriber(event)
+            except Exception as e:
+                logger.error(f"Ошибка отправки события подписчику: {e}")
+                failed_subscribers.append(subscriber)
+        
+        # Удаляем неработающих подписчиков
+        for failed in failed_subscribers:
+            await self.unsubscribe(failed)
+    
     def get_recent_events(self, limit: int = 10) -> List[Dict[str, Any]]:
         """Получить последние события"""
         return self._event_history[-limit:] if self._event_history else []
     
     def get_subscriber_count(self) -> int:
         """Получить количество активных подписчиков"""
-        return len(self._subscribers)
+        return len(self._subscribers) + len(self._sse_clients)
 
 
 class DeviceEventManager:
@@ -79,43 +183,57 @@ class DeviceEventManager:
         self.event_manager = event_manager
         self._device_states: Dict[str, Dict[str, Any]] = {}
         
-    async def device_status_changed(self, device_id: str, old_status: str, new_status: str, 
-                                  ip: str, response_time: float = None):
-        """Уведомить об изменении статуса устройства"""
-        
-        # Сохраняем состояние
-        self._device_states[device_id] = {
-            'status': new_status,
-            'ip': ip,
-            'response_time': response_time,
-            'last_update': datetime.utcnow().isoformat()
-        }
+    async def status_changes(self, changes: List[Dict[str, Any]]):
+        """Уведомить об изменениях статусов устройств за цикл пинга
+
+        Все переходы цикла уходят одним событием device_status_changes;
+        каждый элемент data сохраняет тип прежнего отдельного события
+        (device_failure / device_recovery / device_status).
+        Элемент changes: device_id, ip, old_status, new_status, response_time.
+        """
+        if not changes:
+            return
         
-        # Определяем тип события
-        event_type = 'device_status'
-        if old_status != new_status:
+        timestamp = iso_now()
+        items = []
+        for change in changes:
+            old_status = change['old_status']
+            new_status = change['new_status']
+            
+            # Сохраняем состояние
+            self._device_states[change['device_id']] = {
+                'status': new_status,
+                'ip': change['ip'],
+                'response_time': change['response_time'],
+                'last_update': timestamp
+            }
+            
+            # Определяем тип события
+            event_type = 'device_status'
             if new_status == 'online' and old_status == 'offline':
                 event_type = 'device_recovery'
             elif new_status == 'offline' and old_status == 'online':
                 event_type = 'device_failure'
+            
+            items.append({
+                **change,
+                'type': event_type,
+                'status': new_status,
+                'timestamp': timestamp
+            })
         
-        # Публикуем событие
         await self.event_manager.publish({
-            'type': event_type,
-            'data': {
-                'device_id': device_id,
-                'ip': ip,
-                'old_status': old_status,
-                'new_status': new_status,
-                'status': new_status,
-                'response_time': response_time,
-                'timestamp': datetime.utcnow().isoformat()
-            }
+            'type': 'device_status_changes',
+            'data': items
         })
         
-    async def ping_completed(self, results: List[Dict[str, Any]]):
-        """Уведомить о завершении массового пинга"""
-        online_count = sum(1 for r in results if r.get('status') == 'online')
+    async def ping_completed(self, results: List[Any]):
+        """Уведомить о завершении массового пинга
+
+        results - PingResult мониторинга; в SSE кадр они сериализуются orjson
+        как обычные объекты.
+        """
+        online_count = sum(1 for r in results if r.status == 'online')
         offline_count = len(results) - online_count
         
         await self.event_manager.publish({
@@ -142,11 +260,29 @@ device_event_manager = DeviceEventManager(event_manager)
 class SSEResponse:
     """Класс для Server-Sent Events ответов с heartbeat"""
     
-    def __init__(self):
-        self.queue = asyncio.Queue()
+    def __init__(self, maxsize: int = 1000, max_dropped: int = 100):
+        # Ограниченная очередь: медленный клиент не должен копить события без предела
+        self.queue = asyncio.Queue(maxsize=maxsize)
+        self.max_dropped = max_dropped
+        self.dropped_events = 0
         self.connected = True
-        self.last_heartbeat = datetime.utcnow()
-        self.heartbeat_interval = 15  # Heartbeat каждые 15 секунд
+        # Heartbeat рассылает общая задача sse_heartbeat
+        sse_heartbeat.register(self)
+    
+    def _enqueue(self, frame: bytes):
+        """Положить готовый SSE-кадр в очередь клиента"""
+        try:
+            self.queue.put_nowait(frame)
+        except asyncio.QueueFull:
+            # Клиент не успевает читать - отбрасываем кадр, а при
+            # систематическом отставании отключаем его
+            self.dropped_events += 1
+            if self.dropped_events > self.max_dropped:
+                logger.warning(
+                    f"SSE клиент отстает: отброшено {self.dropped_events} событий, отключаем"
+                )
+                self.connected = False
+                raise ConnectionError("SSE клиент не успевает читать события")
         
     async def send_event(self, event: Dict[str, Any]):
         """Отправить событие клиенту"""
@@ -154,36 +290,30 @@ class SSEResponse:
             return
             
         try:
-            # Форматируем событие для SSE
-            event_data = json.dumps(event, ensure_ascii=False)
-            sse_data = f"data: {event_data}\n\n"
-            await self.queue.put(sse_data)
+            self._enqueue(encode_sse_frame(event))
+        except ConnectionError:
+            raise
         except Exception as e:
             logger.error(f"Ошибка отправки SSE события: {e}")
             self.connected = False
     
-    async def send_heartbeat(self):
-        """Отправить heartbeat клиенту"""
+    def send_frame(self, frame: bytes):
+        """Отправить клиенту заранее закодированный кадр (события, heartbeat)"""
         if not self.connected:
             return
-            
         try:
-            heartbeat_event = {
-                "type": "heartbeat",
-                "data": {
-                    "timestamp": datetime.utcnow().isoformat(),
-                    "server_time": datetime.utcnow().isoformat()
-                }
-            }
-            await self.send_event(heartbeat_event)
-            self.last_heartbeat = datetime.utcnow()
-        except Exception as e:
-            logger.error(f"Ошибка отправки heartbeat: {e}")
+            self._enqueue(frame)
+        except ConnectionError:
+            pass  # Итератор остановится по флагу connected
     
     async def close(self):
         """Закрыть соединение"""
         self.connected = False
-        await self.queue.put(None)  # Сигнал завершения
+        sse_heartbeat.unregister(self)
+        try:
+            self.queue.put_nowait(None)  # Сигнал завершения
+        except asyncio.QueueFull:
+            pass  # Итератор остановится по флагу connected
     
     def __aiter__(self):
         return self
@@ -193,22 +323,70 @@ class SSEResponse:
             raise StopAsyncIteration
             
         try:
-            # Проверяем нужен ли heartbeat
-            now = datetime.utcnow()
-            time_since_heartbeat = (now - self.last_heartbeat).total_seconds()
-            
-            if time_since_heartbeat >= self.heartbeat_interval:
-                await self.send_heartbeat()
-            
-            # Уменьшаем timeout для более частых heartbeat
-            data = await asyncio.wait_for(self.queue.get(), timeout=self.heartbeat_interval)
-            if data is None:  # Сигнал завершения
-                raise StopAsyncIteration
-            return data
-        except asyncio.TimeoutError:
-            # Отправляем heartbeat при timeout
-            await self.send_heartbeat()
-            return ""  # Возвращаем пустую строку, heartbeat уже отправлен
+            data = await self.queue.get()
         except Exception as e:
             logger.error(f"Ошибка в SSE итераторе: {e}")
-            raise StopAsyncIteration
\ No newline at end of file
+            raise StopAsyncIteration
+        
+        if data is None:  # Сигнал завершения
+            raise StopAsyncIteration
+        return data
+
+
+class SSEHeartbeat:
+    """Общий heartbeat для всех SSE клиентов
+
+    Кадр кодируется один раз за тик и раскладывается по очередям клиентов,
+    вместо отдельного таймера и JSON-кодирования в каждом соединении.
+    """
+    
+    def __init__(self, interval: int = 15):
+        self.interval = interval  # Heartbeat каждые 15 секунд
+        self._clients: Set[SSEResponse] = set()
+        self._task: Optional[asyncio.Task] = None
+    
+    def register(self, client: SSEResponse):
+        """Добавить клиента; задача heartbeat стартует с первым клиентом"""
+        self._clients.add(client)
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+    
+    def unregister(self, client: SSEResponse):
+        """Убрать клиента; задача завершится, когда клиентов не останется"""
+        self._clients.discard(client)
+    
+    async def _run(self):
+        while self._clients:
+            await asyncio.sleep(self.interval)
+            now = iso_now()
+            frame = encode_sse_frame({
+                "type": "heartbeat",
+                "data": {
+                    "timestamp": now,
+                    "server_time": now
+                }
+            })
+            for client in list(self._clients):
+                client.send_frame(frame)
+
+
+sse_heartbeat = SSEHeartbeat()
+
+
+class SSEStreamResponse(StreamingResponse):
+    """Потоковый ответ для SSE из готовых байтовых кадров
+
+    Кадры уже закодированы (orjson), поэтому каждый чанк передается в ASGI
+    send как есть, без проверки типа и перекодирования в StreamingResponse.
+    Пустые чанки не отправляются.
+    """
+    
+    media_type = "text/event-stream"
+    
+    async def stream_response(self, send: Send) -> None:
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        async for frame in self.body_iterator:
+            if frame:
+                await send({"type": "http.response.body", "body": frame, "more_body": True})
+        
+        await send({"type": "http.response.body", "body": b"", "more_body": False})
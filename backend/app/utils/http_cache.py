@@ -0,0 +1,30 @@
+"""
+Условные GET-запросы (ETag / If-None-Match)
+"""
+
+import zlib
+from typing import Any, Optional
+
+from fastapi import Request, Response
+
+
+def weak_etag(*parts: Any) -> str:
+    """Слабый ETag из дешевых агрегатов (число строк, max(updated_at) и т.п.)"""
+    return f'W/"{zlib.crc32(repr(parts).encode()):08x}"'
+
+
+def not_modified(request: Request, etag: str) -> Optional[Response]:
+    """Вернуть 304, если клиент прислал совпадающий If-None-Match"""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and (
+        if_none_match.strip() == "*"
+        or etag in (tag.strip() for tag in if_none_match.split(","))
+    ):
+        return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "no-cache"})
+    return None
+
+
+def set_etag(response: Response, etag: str):
+    """Проставить ETag; no-cache заставляет браузер перепроверять ответ"""
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = "no-cache"
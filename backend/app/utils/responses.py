@@ -0,0 +1,21 @@
+"""
+Ответы для доверенных данных из БД
+"""
+
+from typing import Any, Mapping, Optional
+
+import orjson
+from fastapi import Response
+
+
+def trusted_json_response(content: Any, headers: Optional[Mapping[str, str]] = None) -> Response:
+    """JSON-ответ без повторной валидации через response_model
+
+    Строки из БД уже типизированы SQLModel, поэтому их сериализуем напрямую
+    через orjson. response_model на эндпоинте остается только для схемы OpenAPI.
+    """
+    return Response(
+        content=orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS),
+        media_type="application/json",
+        headers=headers,
+    )
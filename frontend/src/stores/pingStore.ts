@@ -413,9 +413,8 @@ export const usePingStore = defineStore('ping', () => {
       lastHeartbeat.value = new Date()
     })
 
-    // Подписываемся на события изменения статуса устройств
-    eventStream.on('device_status', (event) => {
-      const data = event.data || event
+    // Применить статус одного устройства из события
+    const applyDeviceStatus = (data: any) => {
       const device = devices.value.find(d => d.device_id === data.device_id)
       if (device) {
         device.status = data.status
@@ -439,6 +438,25 @@ export const usePingStore = defineStore('ping', () => {
       if (recentEvents.value.length > 50) {
         recentEvents.value = recentEvents.value.slice(0, 50)
       }
+    }
+
+    // Подписываемся на события изменения статуса устройств
+    eventStream.on('device_status', (event) => {
+      applyDeviceStatus(event.data || event)
+    })
+
+    // Массовый пинг присылает все статусы одним событием
+    eventStream.on('device_status_bulk', (event) => {
+      for (const data of event.data || []) {
+        applyDeviceStatus(data)
+      }
+    })
+
+    // Смены статусов за цикл мониторинга приходят одним событием
+    eventStream.on('device_status_changes', (event) => {
+      for (const data of event.data || []) {
+        applyDeviceStatus(data)
+      }
     })
 
     // Подписываемся на другие события